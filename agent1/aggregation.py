@@ -0,0 +1,124 @@
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import numpy as np
+
+SECONDS_PER_DAY = 86400
+# Coarse weather categories, checked in order, with the description keywords that map to each.
+WEATHER_CATEGORIES = (
+    ("storm", ("thunder", "tornado", "squall")),
+    ("snow", ("snow", "sleet")),
+    ("rain", ("rain", "drizzle", "shower")),
+    ("fog", ("mist", "fog", "haze", "smoke", "dust", "sand", "ash")),
+    ("clouds", ("cloud", "overcast")),
+    ("clear", ("clear", "sun")),
+)
+
+
+def weather_category(description: str) -> str:
+    """Maps an OpenWeatherMap description (e.g. "light rain") to a coarse category ("rain")."""
+    description = description.lower()
+    for category, keywords in WEATHER_CATEGORIES:
+        if any(keyword in description for keyword in keywords):
+            return category
+    return "other"
+
+
+def _to_columns(payloads: list[dict]) -> dict[str, "np.ndarray"]:
+    """
+    Flattens the 3-hour slots of several OpenWeatherMap forecast payloads into columnar arrays.
+
+    ``location`` holds the index of the payload each slot came from and ``local_day`` the slot's
+    day number (days since the epoch) in the destination's own timezone (``city.timezone``).
+    """
+    location, dt, offset, temp, description, precipitation, wind = [], [], [], [], [], [], []
+    for index, payload in enumerate(payloads):
+        timezone_offset = (payload.get("city") or {}).get("timezone", 0)
+        for slot in payload.get("list", []):
+            location.append(index)
+            dt.append(slot["dt"])
+            offset.append(timezone_offset)
+            temp.append(slot["main"]["temp"])
+            description.append(slot["weather"][0]["description"])
+            precipitation.append((slot.get("rain") or {}).get("3h", 0.0) + (slot.get("snow") or {}).get("3h", 0.0))
+            wind.append((slot.get("wind") or {}).get("speed", 0.0))
+    import numpy as np
+
+    dt = np.asarray(dt, dtype=np.int64)
+    return {
+        "location": np.asarray(location, dtype=np.int64),
+        "local_day": (dt + np.asarray(offset, dtype=np.int64)) // SECONDS_PER_DAY,
+        "temp": np.asarray(temp, dtype=np.float64),
+        "description": np.asarray(description, dtype=object),
+        "precipitation": np.asarray(precipitation, dtype=np.float64),
+        "wind": np.asarray(wind, dtype=np.float64),
+    }
+
+
+def aggregate_daily_forecasts(payloads: list[dict], days: Optional[int] = None) -> list[list[dict]]:
+    """
+    Aggregates the 3-hour forecast slots of one or more locations into daily summaries.
+
+    All slots of all payloads are grouped by ``(location, destination-local date)`` in a single
+    vectorized pass.
+
+    Args:
+        payloads: Raw OpenWeatherMap forecast payloads (``{"list": [...], "city": {...}}``).
+        days: Optional number of days to keep per location, starting with the earliest.
+
+    Returns:
+        One list per payload, in the same order, of daily dictionaries with ``date`` (local
+        ``YYYY-MM-DD``), ``min_temp``, ``max_temp``, ``mean_temp``, ``description`` (the most frequent
+        one), ``precipitation_mm`` (rain plus snow) and ``max_wind_speed``.
+    """
+    # numpy is imported on first use to keep it off the start-up path of the app and CLI.
+    import numpy as np
+
+    results = [[] for _ in payloads]
+    columns = _to_columns(payloads)
+    if not len(columns["location"]):
+        return results
+
+    # Sort slots by (location, local day) and find where each group starts.
+    order = np.lexsort((columns["local_day"], columns["location"]))
+    location = columns["location"][order]
+    local_day = columns["local_day"][order]
+    temp = columns["temp"][order]
+    precipitation = columns["precipitation"][order]
+    wind = columns["wind"][order]
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = (location[1:] != location[:-1]) | (local_day[1:] != local_day[:-1])
+    starts = np.flatnonzero(new_group)
+    group = np.cumsum(new_group) - 1
+    counts = np.diff(np.append(starts, len(order)))
+
+    min_temp = np.minimum.reduceat(temp, starts)
+    max_temp = np.maximum.reduceat(temp, starts)
+    mean_temp = np.add.reduceat(temp, starts) / counts
+    total_precipitation = np.add.reduceat(precipitation, starts)
+    max_wind = np.maximum.reduceat(wind, starts)
+
+    # Mode of the description per group: count (group, description code) pairs in one bincount.
+    # Ties go to the description that occurs first in the day.
+    labels, codes = np.unique(columns["description"][order], return_inverse=True)
+    pair_counts = np.bincount(group * len(labels) + codes, minlength=len(starts) * len(labels)).reshape(len(starts), len(labels))
+    first_seen = np.full((len(starts), len(labels)), len(order))
+    np.minimum.at(first_seen, (group, codes), np.arange(len(order)))
+    best = pair_counts.max(axis=1, keepdims=True)
+    mode = np.where(pair_counts == best, first_seen, len(order)).argmin(axis=1)
+
+    dates = local_day[starts].astype("datetime64[D]").astype(str)
+    for i, start in enumerate(starts):
+        daily = results[location[start]]
+        if days is not None and len(daily) >= days:
+            continue
+        daily.append({
+            "date": str(dates[i]),
+            "min_temp": float(min_temp[i]),
+            "max_temp": float(max_temp[i]),
+            "mean_temp": float(mean_temp[i]),
+            "description": str(labels[mode[i]]),
+            "precipitation_mm": float(total_precipitation[i]),
+            "max_wind_speed": float(max_wind[i]),
+        })
+    return results
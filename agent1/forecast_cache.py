@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from typing import Optional
+
+from common.cache import LRUCache, SQLiteCache, TieredCache, get_cache_path
+
+# OpenWeatherMap's 5-day forecast is published in 3-hour steps, so a cached payload is
+# valid until the next 3-hour boundary (UTC) and never longer.
+FORECAST_UPDATE_INTERVAL = 3 * 3600
+# Size of a grid cell in degrees; 0.1° is roughly 11 km at the equator.
+FORECAST_GRID_DEGREES = float(os.getenv("FORECAST_GRID_DEGREES", 0.1))
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", 512))
+# How long after a forecast update a superseded forecast is kept as a fallback for when
+# OpenWeatherMap is slow or down.
+FORECAST_STALE_TTL = float(os.getenv("FORECAST_STALE_TTL", 24 * 3600))
+
+
+def snap_to_grid(lat: float, lon: float, grid: float = FORECAST_GRID_DEGREES) -> tuple[float, float]:
+    """Snaps coordinates to the centre of their grid cell so nearby places share one forecast."""
+    return round(round(float(lat) / grid) * grid, 4), round(round(float(lon) / grid) * grid, 4)
+
+
+def next_forecast_update(now: Optional[float] = None) -> float:
+    """Returns the Unix timestamp of the next 3-hour forecast boundary after ``now``."""
+    now = time.time() if now is None else now
+    return (int(now // FORECAST_UPDATE_INTERVAL) + 1) * FORECAST_UPDATE_INTERVAL
+
+
+class ForecastCache:
+    """
+    Cache of raw OpenWeatherMap forecast payloads keyed by grid cell.
+
+    The full 3-hour ``list`` (and the ``city`` block) is stored, so any ``days`` value from 1 to 5
+    is served from the same entry. Entries are fresh until the next forecast update boundary and
+    are then only returned by ``get_stale`` for another ``stale_ttl`` seconds.
+
+    Args:
+        path: The SQLite database file, or ``None`` to keep the cache in memory only.
+        grid: The size of a grid cell in degrees.
+        max_entries: The size of the in-process LRU tier.
+        stale_ttl: How long superseded forecasts are kept for ``get_stale``.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        grid: float = FORECAST_GRID_DEGREES,
+        max_entries: int = FORECAST_CACHE_SIZE,
+        stale_ttl: float = FORECAST_STALE_TTL,
+    ):
+        self.grid = grid
+        self.stale_ttl = stale_ttl
+        disk = SQLiteCache(path, table="forecast") if path else None
+        self._cache = TieredCache(LRUCache(max_entries=max_entries), disk)
+
+    def cell(self, lat: float, lon: float) -> tuple[float, float]:
+        return snap_to_grid(lat, lon, self.grid)
+
+    def _key(self, lat: float, lon: float) -> str:
+        cell_lat, cell_lon = self.cell(lat, lon)
+        return f"{cell_lat:.4f},{cell_lon:.4f}"
+
+    def get(self, lat: float, lon: float) -> Optional[dict]:
+        """Returns the cached ``{"list": [...], "city": {...}}`` payload for the cell, or ``None`` if there is no current one."""
+        payload = self._cache.get(self._key(lat, lon))
+        if payload is None or payload.get("fresh_until", 0) <= time.time():
+            return None
+        return payload
+
+    def get_stale(self, lat: float, lon: float) -> Optional[dict]:
+        """
+        Returns the cell's most recent payload even if a newer forecast has been published since,
+        without the 3-hour slots that are already over, or ``None`` if there is none.
+        """
+        payload = self._cache.get(self._key(lat, lon))
+        if payload is None:
+            return None
+        now = time.time()
+        slots = [slot for slot in payload["list"] if slot["dt"] + FORECAST_UPDATE_INTERVAL > now]
+        return {**payload, "list": slots} if slots else None
+
+    def set(self, lat: float, lon: float, weather_data: dict) -> None:
+        fresh_until = next_forecast_update()
+        payload = {"list": weather_data.get("list", []), "city": weather_data.get("city", {}), "fresh_until": fresh_until}
+        self._cache.set(self._key(lat, lon), payload, expires_at=fresh_until + self.stale_ttl)
+
+    def stats(self) -> dict[str, int]:
+        return self._cache.stats()
+
+
+_forecast_cache: Optional[ForecastCache] = None
+_forecast_cache_lock = threading.Lock()
+
+
+def get_forecast_cache() -> ForecastCache:
+    """Returns the process-wide forecast cache, backed by ``forecast.sqlite3`` in the cache directory."""
+    global _forecast_cache
+    with _forecast_cache_lock:
+        if _forecast_cache is None:
+            _forecast_cache = ForecastCache(path=get_cache_path("forecast.sqlite3"))
+        return _forecast_cache
@@ -0,0 +1,84 @@
+import os
+import threading
+import unicodedata
+from typing import Optional
+
+from common.cache import LRUCache, SQLiteCache, TieredCache, get_cache_path
+
+# Place coordinates practically never change; "not found" answers are kept for less time
+# so that a typo fixed upstream in OpenStreetMap is eventually picked up.
+GEOCODE_CACHE_TTL = float(os.getenv("GEOCODE_CACHE_TTL", 30 * 24 * 3600))
+GEOCODE_CACHE_NEGATIVE_TTL = float(os.getenv("GEOCODE_CACHE_NEGATIVE_TTL", 24 * 3600))
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", 2048))
+
+
+def normalize_place_name(place: str) -> str:
+    """
+    Folds case, whitespace and diacritics so that e.g. " São  Paulo" and "sao paulo" share a key.
+    """
+    decomposed = unicodedata.normalize("NFKD", place)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(stripped.casefold().split()).strip(" .,;:!?'\"")
+
+
+class GeocodeCache:
+    """
+    Two-tier (in-process LRU + SQLite) cache of Nominatim lookups keyed by normalized place name.
+
+    Cached values are ``{"lat": ..., "lon": ...}`` dictionaries; an empty dictionary records a
+    place Nominatim could not find, so repeated bad queries do not reach the network either.
+
+    Args:
+        path: The SQLite database file, or ``None`` to keep the cache in memory only.
+        max_entries: The size of the in-process LRU tier.
+        ttl: The time-to-live in seconds of found coordinates.
+        negative_ttl: The time-to-live in seconds of "not found" results.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: int = GEOCODE_CACHE_SIZE,
+        ttl: float = GEOCODE_CACHE_TTL,
+        negative_ttl: float = GEOCODE_CACHE_NEGATIVE_TTL,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        disk = SQLiteCache(path, table="geocode") if path else None
+        self._cache = TieredCache(LRUCache(max_entries=max_entries), disk)
+        self._negative_hits = 0
+        self._negative_hits_lock = threading.Lock()
+
+    def get(self, place: str) -> Optional[dict]:
+        """
+        Returns the cached coordinates for a place, an empty dictionary for a cached "not found"
+        result, or ``None`` on a cache miss.
+        """
+        coordinates = self._cache.get(normalize_place_name(place))
+        if coordinates == {}:
+            with self._negative_hits_lock:
+                self._negative_hits += 1
+        return coordinates
+
+    def set(self, place: str, coordinates: dict) -> None:
+        ttl = self.ttl if coordinates else self.negative_ttl
+        self._cache.set(normalize_place_name(place), coordinates, ttl=ttl)
+
+    def stats(self) -> dict[str, int]:
+        """Returns the hit/miss counters of both tiers plus the number of negative hits."""
+        stats = self._cache.stats()
+        stats["negative_hits"] = self._negative_hits
+        return stats
+
+
+_geocode_cache: Optional[GeocodeCache] = None
+_geocode_cache_lock = threading.Lock()
+
+
+def get_geocode_cache() -> GeocodeCache:
+    """Returns the process-wide geocode cache, backed by ``geocode.sqlite3`` in the cache directory."""
+    global _geocode_cache
+    with _geocode_cache_lock:
+        if _geocode_cache is None:
+            _geocode_cache = GeocodeCache(path=get_cache_path("geocode.sqlite3"))
+        return _geocode_cache
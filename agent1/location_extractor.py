@@ -0,0 +1,131 @@
+import os
+import re
+import threading
+from typing import Optional
+
+from agent1.geocode_cache import normalize_place_name
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(__file__), "data", "gazetteer.txt")
+# Below this confidence the caller should fall back to the Gemini extractor.
+LOCAL_EXTRACTION_MIN_CONFIDENCE = float(os.getenv("LOCAL_EXTRACTION_MIN_CONFIDENCE", 0.8))
+
+# Words that commonly introduce the destination in a travel query.
+_TRIGGERS = r"(?:trip|travel(?:l?ing)?|going|headed|heading|fly(?:ing)?|vacation|holiday|visit(?:ing)?|tour(?:ing)?|explore|exploring|weather)"
+_TRIGGER_PATTERN = re.compile(
+    rf"\b(?i:{_TRIGGERS}\s+(?:to|in|of|at|for|around)?)\s*(?P<place>[A-Z][^\W\d_]*(?:[\s'\-][A-Z][^\W\d_]*){{0,3}})"
+)
+_TRIGGER_BEFORE_PATTERN = re.compile(rf"\b{_TRIGGERS}\s+(?:to|in|of|at|for|around)?\s*$", re.IGNORECASE)
+_TOKEN_PATTERN = re.compile(r"[^\W\d_]+")
+# A capitalized word right before a match, or right after it (directly, past a comma or past a
+# connector such as "de" or "of"), means the match is probably only part of a longer name the
+# gazetteer lacks: "New Mexico", "Paris, Texas", "Santiago de Compostela".
+_CAPITALIZED_BEFORE_PATTERN = re.compile(r"\b[A-Z][^\W\d_]+[\s\-]+$")
+_CAPITALIZED_AFTER_PATTERN = re.compile(r"^(?:[\s\-]+|\s*,\s*|\s+(?:de|del|de la|da|do|of|on|upon)\s+)[A-Z][^\W\d_]+")
+# Confidence of a gazetteer match that looks like part of a longer name; below the default threshold.
+PARTIAL_MATCH_CONFIDENCE = 0.5
+
+
+class PlaceTrie:
+    """
+    A word-level trie of place names for multi-word, case- and diacritic-insensitive matching.
+
+    Each node is a dictionary from a normalized token to its child node; the ``None`` key of a
+    node holds the canonical name of the place ending there.
+    """
+
+    def __init__(self, names: list[str] = ()):
+        self.root: dict = {}
+        self.max_depth = 0
+        for name in names:
+            self.add(name)
+
+    def add(self, name: str) -> None:
+        tokens = normalize_place_name(name).split()
+        if not tokens:
+            return
+        node = self.root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node[None] = name
+        self.max_depth = max(self.max_depth, len(tokens))
+
+    def find_all(self, text: str) -> list[tuple[str, int, int]]:
+        """
+        Returns the longest non-overlapping place matches in ``text`` as ``(name, start, end)``
+        character spans. Each token is visited at most ``max_depth`` times, so the scan is linear
+        in the length of the text.
+        """
+        tokens = [(normalize_place_name(match.group()), match.start(), match.end()) for match in _TOKEN_PATTERN.finditer(text)]
+        matches = []
+        i = 0
+        while i < len(tokens):
+            node = self.root
+            longest = None
+            for j in range(i, min(i + self.max_depth, len(tokens))):
+                node = node.get(tokens[j][0])
+                if node is None:
+                    break
+                if None in node:
+                    longest = (node[None], j)
+            if longest is None:
+                i += 1
+                continue
+            name, last = longest
+            matches.append((name, tokens[i][1], tokens[last][2]))
+            i = last + 1
+        return matches
+
+
+def load_gazetteer(path: str = GAZETTEER_PATH) -> PlaceTrie:
+    """Builds a ``PlaceTrie`` from a gazetteer file with one place name per line and ``#`` comments."""
+    with open(path, encoding="utf-8") as gazetteer_file:
+        names = [line.strip() for line in gazetteer_file if line.strip() and not line.startswith("#")]
+    return PlaceTrie(names)
+
+
+_gazetteer: Optional[PlaceTrie] = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> PlaceTrie:
+    """Returns the process-wide gazetteer trie, loading it on first use."""
+    global _gazetteer
+    with _gazetteer_lock:
+        if _gazetteer is None:
+            _gazetteer = load_gazetteer()
+        return _gazetteer
+
+
+def extract_location_locally(query: str) -> tuple[str, float]:
+    """
+    Extracts a location from a query without calling an LLM.
+
+    A single gazetteer match is a confident answer, especially when it follows a travel phrase
+    ("trip to X", "visit X in"), unless capitalized words next to it suggest it is only part of a
+    longer name ("New Mexico", "Paris, Texas"). Such partial matches, several different matches,
+    or a capitalized phrase after a travel phrase that is not in the gazetteer, are returned with
+    a low confidence so the caller can fall back to a model.
+
+    Args:
+        query: The user's query.
+
+    Returns:
+        A tuple containing the location name (str, empty if nothing was found) and a confidence
+        between 0 and 1 (float).
+    """
+    matches = get_gazetteer().find_all(query)
+    places = {normalize_place_name(name): name for name, _, _ in matches}
+    if len(places) == 1:
+        name, start, end = matches[0]
+        after_trigger = _TRIGGER_BEFORE_PATTERN.search(query[:start]) is not None
+        if (not after_trigger and _CAPITALIZED_BEFORE_PATTERN.search(query[:start])) or _CAPITALIZED_AFTER_PATTERN.match(query[end:]):
+            return name, PARTIAL_MATCH_CONFIDENCE
+        return name, 0.95 if after_trigger else 0.85
+    if len(places) > 1:
+        # e.g. "Kochi or Munnar": return the first one, but let the model decide.
+        return matches[0][0], 0.5
+
+    pattern_match = _TRIGGER_PATTERN.search(query)
+    if pattern_match:
+        return pattern_match.group("place").strip(), 0.6
+    return "", 0.0
@@ -1,28 +1,66 @@
-import google.generativeai as genai
+from typing import Optional
+
 import requests
-from datetime import datetime
 
-def extract_location(query: str, api_key: str) -> tuple[str, list[dict]]:
+from agent1.aggregation import aggregate_daily_forecasts
+from agent1.forecast_cache import get_forecast_cache
+from agent1.geocode_cache import get_geocode_cache
+from agent1.location_extractor import LOCAL_EXTRACTION_MIN_CONFIDENCE, extract_location_locally
+from common.clients import GEMINI_MODEL_NAME, GEMINI_TIMEOUT, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, get_gemini_model, get_http_session
+from common.deadline import Deadline, DeadlineExceeded, hedged_call
+from common.llm_cache import token_counts
+from common.scheduler import GEMINI, NOMINATIM, OPENWEATHERMAP, UpstreamOverloaded, estimate_tokens, is_rate_limit_error, try_acquire, upstream_call
+from common.tracing import trace_span
+
+def _http_get(url: str, params: dict, deadline: Deadline) -> requests.Response:
+    """GETs ``url`` through the shared session with timeouts capped at the deadline; raises on HTTP errors."""
+    timeout = (deadline.timeout(HTTP_CONNECT_TIMEOUT), deadline.timeout(HTTP_READ_TIMEOUT))
+    response = get_http_session().get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+    return response
+
+def extract_location(query: str, api_key: str, deadline: Optional[Deadline] = None) -> tuple[str, list[dict]]:
     """
-    Extracts the location from a natural language query using a generative model.
+    Extracts the location from a natural language query.
+
+    A local gazetteer/pattern extractor is tried first; the generative model is only called
+    when its confidence is below ``LOCAL_EXTRACTION_MIN_CONFIDENCE``.
 
     Args:
         query: The user's query.
         api_key: The Google AI API key.
+        deadline: The request's deadline, which bounds the Gemini call (none by default).
 
     Returns:
         A tuple containing the extracted location name (str) and a list of log entries (list[dict]).
     """
+    deadline = deadline or Deadline()
     logs = []
     logs.append({"step": "Starting location extraction", "status": "started", "details": f"Query: '{query}'"})
+
+    with trace_span("location.local") as span:
+        location, confidence = extract_location_locally(query)
+        span.set(confidence=confidence)
+    if location and confidence >= LOCAL_EXTRACTION_MIN_CONFIDENCE:
+        logs.append({"step": "Local location extraction", "status": "completed", "details": f"Location extracted: '{location}' (confidence {confidence:.2f}). Skipping Gemini call."})
+        return location, logs
+    logs.append({"step": "Local location extraction", "status": "completed", "details": f"Low confidence ({confidence:.2f}) for '{location}'. Falling back to Gemini."})
+
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        logs.append({"step": "Calling Gemini model for location extraction", "status": "in_progress", "details": "Model: 'gemini-2.5-flash'"})
-        
-        response = model.generate_content(f"From the following sentence, extract ONLY the name of the location. If no location is explicitly mentioned or it's unclear, respond with 'None'. Sentence: '{query}'")
-        
-        location = response.text.strip()
+        model = get_gemini_model(api_key)
+        prompt = f"From the following sentence, extract ONLY the name of the location. If no location is explicitly mentioned or it's unclear, respond with 'None'. Sentence: '{query}'"
+        with trace_span("gemini.location", logs, "Calling Gemini model for location extraction", details=f"Model: '{GEMINI_MODEL_NAME}'") as span:
+            prompt_tokens = estimate_tokens(prompt)
+            with upstream_call(GEMINI, prompt_tokens, deadline) as waited:
+                span.set(queue_wait_ms=round(waited * 1000, 3))
+                response = hedged_call(
+                    "gemini.location",
+                    lambda: model.generate_content(prompt, request_options={"timeout": deadline.timeout(GEMINI_TIMEOUT)}),
+                    deadline,
+                    hedge_slot=lambda: try_acquire(GEMINI, prompt_tokens),
+                )
+            location = response.text.strip()
+            span.set(prompt_chars=len(prompt), response_chars=len(location), **token_counts(response))
         
         if location.lower() == 'none':
             logs.append({"step": "Gemini model response", "status": "completed", "details": f"No location found. Model returned: '{location}'"})
@@ -34,7 +72,74 @@ def extract_location(query: str, api_key: str) -> tuple[str, list[dict]]:
         logs.append({"step": "Error during location extraction", "status": "error", "details": str(e)})
         return "", logs
 
-def get_weather(place: str, days: int, api_key: str, google_ai_api_key: str) -> tuple[list[dict], str, list[dict]]:
+def _geocode(location_name: str, logs: list[dict], deadline: Deadline) -> dict:
+    """
+    Resolves a place name to ``{"lat", "lon"}`` through the geocode cache and Nominatim.
+    Returns an empty dictionary if the place could not be found.
+    """
+    # Geocoding using Nominatim, behind a persistent cache of previous lookups
+    with trace_span("nominatim", logs, "Geocoding location", details=f"Resolving '{location_name}' (geocode cache, then Nominatim API)") as span:
+        geocode_cache = get_geocode_cache()
+        coordinates = geocode_cache.get(location_name)
+        span.set(cache_hit=coordinates is not None)
+        if coordinates is not None:
+            logs.append({"step": "Geocoding cache hit", "status": "completed", "details": f"Reusing cached geocoding result for '{location_name}'"})
+            return coordinates
+
+        geocode_url = "https://nominatim.openstreetmap.org/search"
+        with upstream_call(NOMINATIM, deadline=deadline) as waited:
+            span.set(queue_wait_ms=round(waited * 1000, 3))
+            # Nominatim's usage policy allows no duplicate requests, so it is bounded but not hedged.
+            geocode_response = hedged_call(NOMINATIM, lambda: _http_get(geocode_url, {"q": location_name, "format": "json"}, deadline), deadline)
+        location_data = geocode_response.json()
+        span.set(response_bytes=len(geocode_response.content))
+        coordinates = {"lat": location_data[0]["lat"], "lon": location_data[0]["lon"]} if location_data else {}
+        geocode_cache.set(location_name, coordinates)
+        return coordinates
+
+def _fetch_forecast(lat: str, lon: str, api_key: str, logs: list[dict], deadline: Deadline) -> dict:
+    """
+    Fetches the raw 5-day/3-hour forecast for the coordinates' grid cell, from the forecast cache
+    when possible. Returns a payload with an empty ``list`` if OpenWeatherMap returned no forecast.
+    If OpenWeatherMap fails or does not answer within the deadline, the cell's last (stale)
+    forecast is returned instead when there is one.
+    """
+    # Weather forecast using OpenWeatherMap 5-day/3-hour forecast, cached per grid cell
+    # until the next 3-hour forecast update
+    with trace_span("openweathermap", logs, "Fetching weather forecast", details="Using forecast cache, then OpenWeatherMap 5-day/3-hour forecast API") as span:
+        forecast_cache = get_forecast_cache()
+        weather_data = forecast_cache.get(lat, lon)
+        span.set(cache_hit=weather_data is not None)
+        if weather_data is not None:
+            logs.append({"step": "Forecast cache hit", "status": "completed", "details": f"Reusing cached forecast for grid cell {forecast_cache.cell(lat, lon)}"})
+            return weather_data
+
+        cell_lat, cell_lon = forecast_cache.cell(lat, lon)
+        weather_url = "https://api.openweathermap.org/data/2.5/forecast"
+        weather_params = {"lat": cell_lat, "lon": cell_lon, "appid": api_key, "units": "metric"}
+        try:
+            with upstream_call(OPENWEATHERMAP, deadline=deadline) as waited:
+                span.set(queue_wait_ms=round(waited * 1000, 3))
+                weather_response = hedged_call(
+                    OPENWEATHERMAP,
+                    lambda: _http_get(weather_url, weather_params, deadline),
+                    deadline,
+                    hedge_slot=lambda: try_acquire(OPENWEATHERMAP),
+                )
+        except (requests.exceptions.RequestException, DeadlineExceeded, UpstreamOverloaded) as e:
+            weather_data = forecast_cache.get_stale(lat, lon)
+            if weather_data is None:
+                raise
+            span.set(stale=True)
+            logs.append({"step": "Using stale forecast", "status": "completed", "details": f"OpenWeatherMap unavailable ({e}); reusing the previous forecast for grid cell {(cell_lat, cell_lon)}"})
+            return weather_data
+        weather_data = weather_response.json()
+        span.set(response_bytes=len(weather_response.content))
+        if weather_data.get("list"):
+            forecast_cache.set(lat, lon, weather_data)
+        return weather_data
+
+def get_weather(place: str, days: int, api_key: str, google_ai_api_key: str, deadline: Optional[Deadline] = None) -> tuple[list[dict], str, list[dict]]:
     """
     Gets the weather forecast for a given place and number of days.
 
@@ -43,6 +148,8 @@ def get_weather(place: str, days: int, api_key: str, google_ai_api_key: str) ->
         days: The number of days for the forecast.
         api_key: The OpenWeatherMap API key.
         google_ai_key: The Google AI API key for location extraction.
+        deadline: The time budget for the whole lookup (none by default). Upstream timeouts are
+            capped at what is left of it, and a stale cached forecast is used if it runs out.
 
     Returns:
         A tuple containing:
@@ -51,9 +158,11 @@ def get_weather(place: str, days: int, api_key: str, google_ai_api_key: str) ->
         - A list of log entries (list[dict]).
     """
     weather_agent_logs = []
-    weather_agent_logs.append({"step": "Weather Agent started", "status": "started", "details": f"Query: '{place}', Days: {days}"})
+    with trace_span("weather_agent", weather_agent_logs, "Weather Agent started", status="started", details=f"Query: '{place}', Days: {days}"):
+        return _get_weather(place, days, api_key, google_ai_api_key, weather_agent_logs, deadline or Deadline())
 
-    location_name, extract_logs = extract_location(place, google_ai_api_key)
+def _get_weather(place: str, days: int, api_key: str, google_ai_api_key: str, weather_agent_logs: list[dict], deadline: Deadline) -> tuple[list[dict], str, list[dict]]:
+    location_name, extract_logs = extract_location(place, google_ai_api_key, deadline)
     weather_agent_logs.extend(extract_logs)
 
     if not location_name:
@@ -61,28 +170,17 @@ def get_weather(place: str, days: int, api_key: str, google_ai_api_key: str) ->
         return [], "", weather_agent_logs # Return empty list for structured data
 
     try:
-        # Geocoding using Nominatim
-        weather_agent_logs.append({"step": "Geocoding location", "status": "in_progress", "details": f"Using Nominatim API for '{location_name}'"})
-        geocode_url = f"https://nominatim.openstreetmap.org/search?q={location_name}&format=json"
-        headers = {'User-Agent': 'Multi-Agent-Weather-App/1.0'}
-        geocode_response = requests.get(geocode_url, headers=headers)
-        geocode_response.raise_for_status()
-        location_data = geocode_response.json()
+        coordinates = _geocode(location_name, weather_agent_logs, deadline)
 
-        if not location_data:
+        if not coordinates:
             weather_agent_logs.append({"step": "Geocoding failed", "status": "completed", "details": f"Could not find coordinates for {location_name}"})
             return [], "", weather_agent_logs # Return empty list
         
-        lat = location_data[0]["lat"]
-        lon = location_data[0]["lon"]
+        lat = coordinates["lat"]
+        lon = coordinates["lon"]
         weather_agent_logs.append({"step": "Geocoding completed", "status": "completed", "details": f"Lat: {lat}, Lon: {lon}"})
 
-        # Weather forecast using OpenWeatherMap 5-day/3-hour forecast
-        weather_agent_logs.append({"step": "Fetching weather forecast", "status": "in_progress", "details": "Using OpenWeatherMap 5-day/3-hour forecast API"})
-        weather_url = f"http://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={api_key}&units=metric"
-        weather_response = requests.get(weather_url)
-        weather_response.raise_for_status()
-        weather_data = weather_response.json()
+        weather_data = _fetch_forecast(lat, lon, api_key, weather_agent_logs, deadline)
 
         if not weather_data.get("list"):
             weather_agent_logs.append({"step": "Weather data retrieval failed", "status": "completed", "details": "API returned no forecast list."})
@@ -90,46 +188,38 @@ def get_weather(place: str, days: int, api_key: str, google_ai_api_key: str) ->
 
         weather_agent_logs.append({"step": "Weather data retrieved", "status": "completed", "details": "Successfully fetched forecast data."})
 
+        # Process the 3-hour forecast to get daily summaries in the destination's local time
+        with trace_span("aggregation", weather_agent_logs, "Processing daily forecasts", details="Aggregating 3-hour data into daily summaries."):
+            daily_forecasts = aggregate_daily_forecasts([weather_data], days)[0]
+
         structured_weather_data = []
-        
-        # Process the 3-hour forecast to get daily summary
-        weather_agent_logs.append({"step": "Processing daily forecasts", "status": "in_progress", "details": "Aggregating 3-hour data into daily summaries."})
-        daily_forecasts = {}
-        for forecast in weather_data["list"]:
-            date = datetime.fromtimestamp(forecast["dt"]).strftime('%Y-%m-%d')
-            if date not in daily_forecasts:
-                daily_forecasts[date] = {
-                    "temps": [],
-                    "weather": []
-                }
-            daily_forecasts[date]["temps"].append(forecast["main"]["temp"])
-            daily_forecasts[date]["weather"].append(forecast["weather"][0]["description"])
-
-        day_count = 0
-        for date, data in daily_forecasts.items():
-            if day_count >= days:
-                break
-            
-            min_temp = min(data["temps"])
-            max_temp = max(data["temps"])
-            weather_description = max(set(data["weather"]), key=data["weather"].count)
-            
+        for day in daily_forecasts:
             structured_weather_data.append({
-                "Date": date,
-                "Weather": weather_description.capitalize(),
-                "High Temp (°C)": f"{max_temp:.2f}",
-                "Low Temp (°C)": f"{min_temp:.2f}"
+                "Date": day["date"],
+                "Weather": day["description"].capitalize(),
+                "High Temp (°C)": f"{day['max_temp']:.2f}",
+                "Low Temp (°C)": f"{day['min_temp']:.2f}",
+                "Precipitation (mm)": f"{day['precipitation_mm']:.1f}",
+                "Max Wind (m/s)": f"{day['max_wind_speed']:.1f}"
             })
-            day_count += 1
         
         weather_agent_logs.append({"step": "Daily forecasts processed", "status": "completed", "details": "Generated structured summary for each day."})
         
         return structured_weather_data, location_name, weather_agent_logs
 
+    except UpstreamOverloaded as e:
+        weather_agent_logs.append({"step": "Upstream overloaded", "status": "error", "details": str(e)})
+        return [], "", weather_agent_logs
+    except DeadlineExceeded as e:
+        weather_agent_logs.append({"step": "Time budget exceeded", "status": "error", "details": str(e)})
+        return [], "", weather_agent_logs
     except requests.exceptions.RequestException as e:
-        weather_agent_logs.append({"step": "API request error", "status": "error", "details": str(e)})
+        if is_rate_limit_error(e):
+            weather_agent_logs.append({"step": "Rate limited by upstream", "status": "error", "details": f"Too many requests (HTTP 429); further calls are paused. {e}"})
+        else:
+            weather_agent_logs.append({"step": "API request error", "status": "error", "details": str(e)})
         return [], "", weather_agent_logs
-    except (KeyError, IndexError) as e:
+    except (KeyError, IndexError, TypeError) as e:
         weather_agent_logs.append({"step": "Data parsing error", "status": "error", "details": str(e)})
         return [], "", weather_agent_logs
 
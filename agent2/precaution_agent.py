@@ -1,7 +1,141 @@
+from typing import Iterator, Optional
 
-import google.generativeai as genai
+from agent1.aggregation import weather_category
+from common.clients import GEMINI_MODEL_NAME, GEMINI_TIMEOUT, get_gemini_model
+from common.deadline import Deadline, DeadlineExceeded, hedged_stream
+from common.llm_cache import get_llm_cache, token_counts
+from common.scheduler import GEMINI, UpstreamOverloaded, estimate_tokens, try_acquire, upstream_call
+from common.tracing import trace_span
 
-def get_precautions(weather_report: str, place: str, api_key: str) -> tuple[str, list[dict]]:
+# Thresholds of the rule-based precautions used when Gemini cannot answer in time.
+HOT_DAY_CELSIUS = 30.0
+COLD_NIGHT_CELSIUS = 5.0
+FROST_CELSIUS = 0.0
+HEAVY_PRECIPITATION_MM = 10.0
+STRONG_WIND_MS = 10.0
+
+def rule_based_precautions(structured_weather_data: list[dict], place: str) -> str:
+    """
+    Builds a short list of precautions from the Weather Agent's daily forecast without calling
+    Gemini, for when the model fails or the time budget runs out.
+
+    Args:
+        structured_weather_data: The daily forecast dictionaries returned by the Weather Agent.
+        place: The name of the place.
+
+    Returns:
+        The precautions as a Markdown list, each with the dates it applies to.
+    """
+    advice = {}
+    for day in structured_weather_data:
+        date = day["Date"]
+        category = weather_category(day["Weather"])
+        high, low = float(day["High Temp (°C)"]), float(day["Low Temp (°C)"])
+        precipitation = float(day.get("Precipitation (mm)", 0))
+        wind = float(day.get("Max Wind (m/s)", 0))
+        rules = (
+            (high >= HOT_DAY_CELSIUS, "Hot weather: stay hydrated, wear sunscreen and avoid strenuous activity around midday."),
+            (low <= FROST_CELSIUS, "Frost is likely: wear warm layers and shoes with good grip."),
+            (FROST_CELSIUS < low <= COLD_NIGHT_CELSIUS, "Cold nights: pack warm layers for the evening."),
+            (category == "storm", "Thunderstorms: stay indoors while they pass and keep away from open ground, water and tall trees."),
+            (category == "snow", "Snow: wear waterproof boots and allow extra time for travel."),
+            (precipitation >= HEAVY_PRECIPITATION_MM, "Heavy rain: watch for flooding and check transport before setting out."),
+            (category == "rain" and precipitation < HEAVY_PRECIPITATION_MM, "Rain: carry an umbrella or a rain jacket."),
+            (wind >= STRONG_WIND_MS, "Strong winds: secure loose items and take care on coasts and at heights."),
+            (category == "fog", "Poor visibility: take extra care on the roads."),
+        )
+        for applies, text in rules:
+            if applies:
+                advice.setdefault(text, []).append(date)
+    lines = [f"- {text} ({', '.join(dates)})" for text, dates in advice.items()]
+    if not lines:
+        lines = ["- No weather-related risks stand out; the usual travel precautions apply."]
+    return f"Basic precautions for {place}, based on the forecast:\n" + "\n".join(lines) + "\n"
+
+def stream_precautions(
+    weather_report: str,
+    place: str,
+    api_key: str,
+    logs: list[dict],
+    use_cache: bool = True,
+    deadline: Optional[Deadline] = None,
+    structured_weather_data: Optional[list[dict]] = None,
+) -> Iterator[str]:
+    """
+    Analyzes the weather report and streams suggested precautions from the Gemini API as they are generated.
+
+    Args:
+        weather_report: A string containing the weather report.
+        place: The name of the place.
+        api_key: The Gemini API key.
+        logs: The list that log entries are appended to while streaming.
+        use_cache: Whether to serve and store the response in the LLM response cache.
+        deadline: The time budget for the Gemini call (none by default).
+        structured_weather_data: The Weather Agent's daily forecast. When given, a failure or
+            timeout before any text was generated yields ``rule_based_precautions`` instead of an error.
+
+    Yields:
+        Chunks of the precautions text. On failure the last chunk is the error message.
+    """
+    deadline = deadline or Deadline()
+    with trace_span("precaution_agent", logs, "Precaution Agent started", status="started", details=f"Analyzing weather for: {place}") as agent_span:
+        if "this place is in-serviceable" in weather_report:
+            logs.append({"step": "Skipping precaution generation", "status": "completed", "details": "Location is in-serviceable."})
+            return
+        chunks = []
+        try:
+            prompt = f"Given the following weather report for {place}:\n{weather_report}\n\nPlease provide a list of precautions to take. Focus on practical advice for a tourist."
+            llm_cache = get_llm_cache()
+            cached = llm_cache.get(GEMINI_MODEL_NAME, prompt) if use_cache else None
+            agent_span.set(cache_hit=cached is not None)
+            if cached is not None:
+                logs.append({"step": "LLM cache hit", "status": "completed", "details": f"Reusing cached precautions ({cached['output_tokens']} output tokens)."})
+                yield cached["text"]
+                return
+
+            model = get_gemini_model(api_key, GEMINI_MODEL_NAME)
+            with trace_span("gemini.precautions", logs, "Calling Gemini model for precautions", details=f"Model: '{GEMINI_MODEL_NAME}', Prompt length: {len(prompt)} characters.") as span:
+                prompt_tokens = estimate_tokens(prompt)
+                with upstream_call(GEMINI, prompt_tokens, deadline) as waited:
+                    span.set(queue_wait_ms=round(waited * 1000, 3))
+                    response, stream = hedged_stream(
+                        "gemini.precautions",
+                        lambda: model.generate_content(prompt, stream=True, request_options={"timeout": deadline.timeout(GEMINI_TIMEOUT)}),
+                        deadline,
+                        hedge_slot=lambda: try_acquire(GEMINI, prompt_tokens),
+                    )
+                    for chunk in stream:
+                        if not chunks:
+                            span.set(time_to_first_chunk_ms=round(span.duration * 1000, 3))
+                        chunks.append(chunk.text)
+                        yield chunk.text
+                span.set(prompt_chars=len(prompt), response_chars=sum(len(chunk) for chunk in chunks), **token_counts(response))
+            if use_cache:
+                llm_cache.set(GEMINI_MODEL_NAME, prompt, "".join(chunks), token_counts(response))
+
+            logs.append({"step": "Gemini model response", "status": "completed", "details": "Precautions generated successfully."})
+        except Exception as e:
+            if structured_weather_data and not chunks:
+                logs.append({"step": "Rule-based precautions fallback", "status": "completed", "details": f"Gemini unavailable ({e}); built precautions from the daily forecast."})
+                yield rule_based_precautions(structured_weather_data, place)
+            elif isinstance(e, UpstreamOverloaded):
+                logs.append({"step": "Upstream overloaded", "status": "error", "details": str(e)})
+                yield f"Could not generate precautions right now: {e}"
+            elif isinstance(e, DeadlineExceeded):
+                logs.append({"step": "Time budget exceeded", "status": "error", "details": str(e)})
+                yield "\n\n(Precautions cut short: the time budget ran out.)" if chunks else f"Could not generate precautions in time: {e}"
+            else:
+                logs.append({"step": "Error during precaution generation", "status": "error", "details": str(e)})
+                yield f"An error occurred while generating precautions: {e}"
+
+def get_precautions(
+    weather_report: str,
+    place: str,
+    api_key: str,
+    use_cache: bool = True,
+    deadline: Optional[Deadline] = None,
+    structured_weather_data: Optional[list[dict]] = None,
+) -> tuple[str, list[dict]]:
     """
     Analyzes the weather report and suggests precautions using the Gemini API.
 
@@ -9,28 +143,17 @@ def get_precautions(weather_report: str, place: str, api_key: str) -> tuple[str,
         weather_report: A string containing the weather report.
         place: The name of the place.
         api_key: The Gemini API key.
+        use_cache: Whether to serve and store the response in the LLM response cache.
+        deadline: The time budget for the Gemini call (none by default).
+        structured_weather_data: The Weather Agent's daily forecast, for the rule-based fallback
+            described in ``stream_precautions``.
 
     Returns:
         A tuple containing the precautions string and a list of log entries (list[dict]).
     """
     precautions_agent_logs = []
-    precautions_agent_logs.append({"step": "Precaution Agent started", "status": "started", "details": f"Analyzing weather for: {place}"})
-
-    if "this place is in-serviceable" in weather_report:
-        precautions_agent_logs.append({"step": "Skipping precaution generation", "status": "completed", "details": "Location is in-serviceable."})
-        return "", precautions_agent_logs
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        prompt = f"Given the following weather report for {place}:\n{weather_report}\n\nPlease provide a list of precautions to take. Focus on practical advice for a tourist."
-        precautions_agent_logs.append({"step": "Calling Gemini model for precautions", "status": "in_progress", "details": f"Model: 'gemini-2.5-flash', Prompt length: {len(prompt)} characters."})
-        
-        response = model.generate_content(prompt)
-        precautions = response.text
-        
-        precautions_agent_logs.append({"step": "Gemini model response", "status": "completed", "details": "Precautions generated successfully."})
-        return precautions, precautions_agent_logs
-    except Exception as e:
-        precautions_agent_logs.append({"step": "Error during precaution generation", "status": "error", "details": str(e)})
-        return f"An error occurred while generating precautions: {e}", precautions_agent_logs
+    precautions = "".join(stream_precautions(
+        weather_report, place, api_key, precautions_agent_logs,
+        use_cache=use_cache, deadline=deadline, structured_weather_data=structured_weather_data,
+    ))
+    return precautions, precautions_agent_logs
@@ -1,7 +1,103 @@
+import contextvars
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
 
-import google.generativeai as genai
+from agent3.segment_cache import day_summary, get_segment_cache, summary_changed
+from common.clients import GEMINI_MODEL_NAME, GEMINI_TIMEOUT, get_gemini_model
+from common.deadline import Deadline, DeadlineExceeded, hedged_call, hedged_stream
+from common.llm_cache import get_llm_cache, token_counts
+from common.scheduler import GEMINI, UpstreamOverloaded, estimate_tokens, try_acquire, upstream_call
+from common.tracing import trace_span
 
-def get_itinerary(weather_report: str, place: str, days: int, api_key: str) -> tuple[str, list[dict]]:
+# "full" writes the whole itinerary from one prompt; "per_day" writes and caches one plan per day
+# and only rewrites the days whose weather changed.
+ITINERARY_MODE = os.getenv("ITINERARY_MODE", "full")
+# Changed days are planned in one request; the reply separates them with these marker lines.
+DAY_MARKER_INSTRUCTION = "Start each day's plan with a line containing only '=== <date> ===' with that day's date as given above, and add no other titles."
+# Any line with "===" counts as a marker, so decorated ones ("**=== 2025-01-01 (Monday) ===**") still split the reply.
+_DAY_MARKER_PATTERN = re.compile(r"^.*===.*$", re.MULTILINE)
+
+def stream_itinerary(
+    weather_report: str,
+    place: str,
+    days: int,
+    api_key: str,
+    logs: list[dict],
+    use_cache: bool = True,
+    deadline: Optional[Deadline] = None,
+) -> Iterator[str]:
+    """
+    Streams a travel itinerary from the Gemini API as it is generated.
+
+    Args:
+        weather_report: A string containing the weather report.
+        place: The name of the place.
+        days: The number of days for the itinerary.
+        api_key: The Gemini API key.
+        logs: The list that log entries are appended to while streaming.
+        use_cache: Whether to serve and store the response in the LLM response cache.
+        deadline: The time budget for the Gemini call (none by default).
+
+    Yields:
+        Chunks of the itinerary text. On failure the last chunk is the error message.
+    """
+    deadline = deadline or Deadline()
+    with trace_span("itinerary_agent", logs, "Itinerary Agent started", status="started", details=f"Generating {days}-day itinerary for: {place}") as agent_span:
+        if "this place is in-serviceable" in weather_report:
+            logs.append({"step": "Skipping itinerary generation", "status": "completed", "details": "Location is in-serviceable."})
+            return
+        chunks = []
+        try:
+            prompt = f"Given the following weather report for {place}:\n{weather_report}\n\nPlease create a {days}-day travel itinerary for {place}. The itinerary should suggest activities that are suitable for the weather. Include a mix of indoor and outdoor activities, and suggest some places to eat."
+            llm_cache = get_llm_cache()
+            cached = llm_cache.get(GEMINI_MODEL_NAME, prompt) if use_cache else None
+            agent_span.set(cache_hit=cached is not None)
+            if cached is not None:
+                logs.append({"step": "LLM cache hit", "status": "completed", "details": f"Reusing cached itinerary ({cached['output_tokens']} output tokens)."})
+                yield cached["text"]
+                return
+
+            model = get_gemini_model(api_key, GEMINI_MODEL_NAME)
+            with trace_span("gemini.itinerary", logs, "Calling Gemini model for itinerary", details=f"Model: '{GEMINI_MODEL_NAME}', Prompt length: {len(prompt)} characters.") as span:
+                prompt_tokens = estimate_tokens(prompt)
+                with upstream_call(GEMINI, prompt_tokens, deadline) as waited:
+                    span.set(queue_wait_ms=round(waited * 1000, 3))
+                    response, stream = hedged_stream(
+                        "gemini.itinerary",
+                        lambda: model.generate_content(prompt, stream=True, request_options={"timeout": deadline.timeout(GEMINI_TIMEOUT)}),
+                        deadline,
+                        hedge_slot=lambda: try_acquire(GEMINI, prompt_tokens),
+                    )
+                    for chunk in stream:
+                        if not chunks:
+                            span.set(time_to_first_chunk_ms=round(span.duration * 1000, 3))
+                        chunks.append(chunk.text)
+                        yield chunk.text
+                span.set(prompt_chars=len(prompt), response_chars=sum(len(chunk) for chunk in chunks), **token_counts(response))
+            if use_cache:
+                llm_cache.set(GEMINI_MODEL_NAME, prompt, "".join(chunks), token_counts(response))
+
+            logs.append({"step": "Gemini model response", "status": "completed", "details": "Itinerary generated successfully."})
+        except UpstreamOverloaded as e:
+            logs.append({"step": "Upstream overloaded", "status": "error", "details": str(e)})
+            yield f"Could not generate the itinerary right now: {e}"
+        except DeadlineExceeded as e:
+            logs.append({"step": "Time budget exceeded", "status": "error", "details": str(e)})
+            yield "\n\n(Itinerary cut short: the time budget ran out.)" if chunks else f"Could not generate the itinerary in time: {e}"
+        except Exception as e:
+            logs.append({"step": "Error during itinerary generation", "status": "error", "details": str(e)})
+            yield f"An error occurred while generating the itinerary: {e}"
+
+def get_itinerary(
+    weather_report: str,
+    place: str,
+    days: int,
+    api_key: str,
+    use_cache: bool = True,
+    deadline: Optional[Deadline] = None,
+) -> tuple[str, list[dict]]:
     """
     Generates a travel itinerary using the Gemini API.
 
@@ -10,28 +106,213 @@ def get_itinerary(weather_report: str, place: str, days: int, api_key: str) -> t
         place: The name of the place.
         days: The number of days for the itinerary.
         api_key: The Gemini API key.
+        use_cache: Whether to serve and store the response in the LLM response cache.
+        deadline: The time budget for the Gemini call (none by default).
 
     Returns:
         A tuple containing the travel itinerary string and a list of log entries (list[dict]).
     """
     itinerary_agent_logs = []
-    itinerary_agent_logs.append({"step": "Itinerary Agent started", "status": "started", "details": f"Generating {days}-day itinerary for: {place}"})
+    itinerary = "".join(stream_itinerary(weather_report, place, days, api_key, itinerary_agent_logs, use_cache=use_cache, deadline=deadline))
+    return itinerary, itinerary_agent_logs
 
-    if "this place is in-serviceable" in weather_report:
-        itinerary_agent_logs.append({"step": "Skipping itinerary generation", "status": "completed", "details": "Location is in-serviceable."})
-        return "", itinerary_agent_logs
+
+def _day_heading(number: int, summary: dict) -> str:
+    return f"### Day {number}: {summary['date']} ({summary['weather']}, {summary['low']:.0f}-{summary['high']:.0f}°C)\n\n"
+
+def _split_day_plans(text: str, dates: list[str]) -> dict[str, str]:
+    """
+    Splits a multi-day reply at its marker lines into plans by date. Each section belongs to the
+    first of ``dates`` that its marker line contains; sections whose marker has none are dropped.
+    """
+    plans = {}
+    markers = list(_DAY_MARKER_PATTERN.finditer(text))
+    for marker, next_marker in zip(markers, markers[1:] + [None]):
+        date = next((date for date in dates if date in marker.group()), None)
+        plan = text[marker.end():next_marker.start() if next_marker else len(text)].strip()
+        if date is not None and plan and date not in plans:
+            plans[date] = plan
+    return plans
+
+def _forecast_lines(summaries: list[dict]) -> str:
+    return "\n".join(
+        f"- {summary['date']}: {summary['weather']}, high {summary['high']:.1f}°C, low {summary['low']:.1f}°C, "
+        f"{summary['precipitation_mm']:.1f} mm of precipitation, wind up to {summary['max_wind']:.1f} m/s"
+        for summary in summaries
+    )
+
+def _generate_days(place: str, summaries: list[dict], api_key: str, logs: list[dict], deadline: Deadline) -> tuple[dict[str, str], int]:
+    """
+    Writes the plans for several days in one Gemini request, so a plan costs one request
+    whatever the number of changed days, and returns them by date with the output tokens per day.
+    Days the reply has no readable plan for are left out.
+    """
+    prompt = (
+        f"Plan the following days in {place}. The forecast for each day:\n{_forecast_lines(summaries)}\n\nFor each day, suggest activities "
+        "suitable for its weather for the morning, afternoon and evening, with a mix of indoor and outdoor options, and suggest "
+        f"some places to eat. {DAY_MARKER_INSTRUCTION}"
+    )
+    dates = [summary["date"] for summary in summaries]
+    model = get_gemini_model(api_key, GEMINI_MODEL_NAME)
+    with trace_span("gemini.itinerary_days", logs, f"Calling Gemini model for {', '.join(dates)}", details=f"Model: '{GEMINI_MODEL_NAME}', Prompt length: {len(prompt)} characters.") as span:
+        prompt_tokens = estimate_tokens(prompt)
+        with upstream_call(GEMINI, prompt_tokens, deadline) as waited:
+            span.set(queue_wait_ms=round(waited * 1000, 3))
+            response = hedged_call(
+                "gemini.itinerary_days",
+                lambda: model.generate_content(prompt, request_options={"timeout": deadline.timeout(GEMINI_TIMEOUT)}),
+                deadline,
+                hedge_slot=lambda: try_acquire(GEMINI, prompt_tokens),
+            )
+        text = response.text.strip()
+        tokens = token_counts(response)
+        span.set(prompt_chars=len(prompt), response_chars=len(text), days=len(dates), **tokens)
+    plans = _split_day_plans(text, dates)
+    if len(dates) == 1 and not plans:
+        # A single day needs no marker, so the whole reply is its plan.
+        text = _DAY_MARKER_PATTERN.sub("", text).strip()
+        plans = {dates[0]: text} if text else {}
+    return plans, tokens["output_tokens"] // len(dates)
+
+def _collect_day_plans(future, place: str, stale: list[dict], outdated: dict[str, str], use_cache: bool, logs: list[dict]) -> tuple[dict[str, str], list[dict]]:
+    """
+    Waits for the generated day plans and caches them. Days without a new plan get their outdated
+    plan when they have one. Returns the plans by date and the stale days still without a plan.
+
+    Raises:
+        DeadlineExceeded: If the plans were not generated in time and a day has no outdated plan.
+    """
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        prompt = f"Given the following weather report for {place}:\n{weather_report}\n\nPlease create a {days}-day travel itinerary for {place}. The itinerary should suggest activities that are suitable for the weather. Include a mix of indoor and outdoor activities, and suggest some places to eat."
-        itinerary_agent_logs.append({"step": "Calling Gemini model for itinerary", "status": "in_progress", "details": f"Model: 'gemini-2.5-flash', Prompt length: {len(prompt)} characters."})
-        
-        response = model.generate_content(prompt)
-        itinerary = response.text
-        
-        itinerary_agent_logs.append({"step": "Gemini model response", "status": "completed", "details": "Itinerary generated successfully."})
-        return itinerary, itinerary_agent_logs
-    except Exception as e:
-        itinerary_agent_logs.append({"step": "Error during itinerary generation", "status": "error", "details": str(e)})
-        return f"An error occurred while generating the itinerary: {e}", itinerary_agent_logs
+        plans, output_tokens = future.result()
+    except DeadlineExceeded as e:
+        if any(summary["date"] not in outdated for summary in stale):
+            raise
+        logs.append({"step": "Using outdated day plans", "status": "completed", "details": f"No new plans in time ({e}); reusing the plans written for earlier weather."})
+        return dict(outdated), []
+    if use_cache:
+        segment_cache = get_segment_cache()
+        for summary in stale:
+            if summary["date"] in plans:
+                segment_cache.set(place, summary["date"], summary, plans[summary["date"]], output_tokens)
+    missing = [summary["date"] for summary in stale if summary["date"] not in plans]
+    if not missing:
+        return plans, []
+    plans.update({date: outdated[date] for date in missing if date in outdated})
+    unresolved = [summary for summary in stale if summary["date"] not in plans]
+    logs.append({
+        "step": "Day plans missing from reply",
+        "status": "completed",
+        "details": f"Gemini's reply had no readable plan for {', '.join(missing)}; "
+        + (f"writing {', '.join(summary['date'] for summary in unresolved)} with the single-prompt itinerary." if unresolved else "reusing their outdated plans."),
+    })
+    return plans, unresolved
+
+def stream_itinerary_by_day(
+    structured_weather_data: list[dict],
+    place: str,
+    days: int,
+    api_key: str,
+    logs: list[dict],
+    use_cache: bool = True,
+    deadline: Optional[Deadline] = None,
+) -> Iterator[str]:
+    """
+    Streams a travel itinerary assembled from one plan per day.
+
+    Day plans are cached by place and date together with the weather they were written for. A
+    cached plan is reused unless that day's weather category changed or its high/low moved by
+    more than ``ITINERARY_TEMP_THRESHOLD``. Only the remaining days are generated, all in one
+    Gemini request; if it runs out of time, their outdated cached plans are used when every one has one.
+    Days the reply has no readable plan for also get their outdated plan, or else are written
+    together by the single-prompt itinerary (``stream_itinerary``).
+
+    Args:
+        structured_weather_data: The daily forecast dictionaries returned by the Weather Agent.
+        place: The name of the place.
+        days: The number of days for the itinerary.
+        api_key: The Gemini API key.
+        logs: The list that log entries are appended to while streaming.
+        use_cache: Whether to reuse and store day plans.
+        deadline: The time budget for the Gemini calls (none by default).
+
+    Yields:
+        Each day's heading and plan, in order. On failure the last chunk is the error message.
+    """
+    deadline = deadline or Deadline()
+    with trace_span("itinerary_agent", logs, "Itinerary Agent started", status="started", details=f"Generating {days}-day itinerary for: {place} (per day)") as agent_span:
+        try:
+            summaries = [day_summary(day) for day in structured_weather_data[:days]]
+            segment_cache = get_segment_cache()
+            reused, outdated = {}, {}
+            for summary in summaries:
+                cached = segment_cache.get(place, summary["date"]) if use_cache else None
+                if cached is not None and not summary_changed(cached["summary"], summary):
+                    reused[summary["date"]] = cached["text"]
+                elif cached is not None:
+                    outdated[summary["date"]] = cached["text"]
+            stale = [summary for summary in summaries if summary["date"] not in reused]
+            agent_span.set(cache_hit=not stale, reused_days=len(reused), regenerated_days=len(stale))
+            logs.append({
+                "step": "Day plan cache lookup",
+                "status": "completed",
+                "details": f"Reusing {len(reused)} of {len(summaries)} day plans; generating {', '.join(summary['date'] for summary in stale) or 'none'}.",
+            })
+
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                # Generation starts right away, while the reused days before the first changed one are yielded.
+                future = executor.submit(contextvars.copy_context().run, _generate_days, place, stale, api_key, logs, deadline) if stale else None
+                generated = unresolved = None
+                for number, summary in enumerate(summaries, start=1):
+                    date = summary["date"]
+                    if date in reused:
+                        yield _day_heading(number, summary) + reused[date] + "\n\n"
+                        continue
+                    if generated is None:
+                        generated, unresolved = _collect_day_plans(future, place, stale, outdated, use_cache, logs)
+                    if date in generated:
+                        yield _day_heading(number, summary) + generated[date] + "\n\n"
+                    elif unresolved:
+                        # The days without any plan are written together by the single-prompt itinerary, in place of the first of them.
+                        numbers = [str(summaries.index(day) + 1) for day in unresolved]
+                        yield f"### Days {', '.join(numbers)}: {', '.join(day['date'] for day in unresolved)}\n\n"
+                        weather_report = f"Weather forecast for {place}:\n{_forecast_lines(unresolved)}"
+                        yield from stream_itinerary(weather_report, place, len(unresolved), api_key, logs, use_cache=use_cache, deadline=deadline)
+                        yield "\n\n"
+                        unresolved = []
+
+            logs.append({"step": "Gemini model response", "status": "completed", "details": "Itinerary generated successfully."})
+        except UpstreamOverloaded as e:
+            logs.append({"step": "Upstream overloaded", "status": "error", "details": str(e)})
+            yield f"Could not generate the itinerary right now: {e}"
+        except DeadlineExceeded as e:
+            logs.append({"step": "Time budget exceeded", "status": "error", "details": str(e)})
+            yield f"Could not generate the remaining days in time: {e}"
+        except Exception as e:
+            logs.append({"step": "Error during itinerary generation", "status": "error", "details": str(e)})
+            yield f"An error occurred while generating the itinerary: {e}"
+
+def get_itinerary_by_day(
+    structured_weather_data: list[dict],
+    place: str,
+    days: int,
+    api_key: str,
+    use_cache: bool = True,
+    deadline: Optional[Deadline] = None,
+) -> tuple[str, list[dict]]:
+    """
+    Generates a travel itinerary one day at a time, reusing cached day plans whose weather has not changed.
+
+    Args:
+        structured_weather_data: The daily forecast dictionaries returned by the Weather Agent.
+        place: The name of the place.
+        days: The number of days for the itinerary.
+        api_key: The Gemini API key.
+        use_cache: Whether to reuse and store day plans.
+        deadline: The time budget for the Gemini calls (none by default).
+
+    Returns:
+        A tuple containing the travel itinerary string and a list of log entries (list[dict]).
+    """
+    itinerary_agent_logs = []
+    itinerary = "".join(stream_itinerary_by_day(structured_weather_data, place, days, api_key, itinerary_agent_logs, use_cache=use_cache, deadline=deadline))
+    return itinerary, itinerary_agent_logs
@@ -0,0 +1,81 @@
+import os
+import threading
+from typing import Optional
+
+from agent1.aggregation import weather_category
+from agent1.geocode_cache import normalize_place_name
+from common.cache import LRUCache, SQLiteCache, TieredCache, get_cache_path
+
+# A day's plan is only useful until that day has passed; forecasts reach at most 5 days ahead.
+ITINERARY_SEGMENT_TTL = float(os.getenv("ITINERARY_SEGMENT_TTL", 7 * 24 * 3600))
+ITINERARY_SEGMENT_CACHE_SIZE = int(os.getenv("ITINERARY_SEGMENT_CACHE_SIZE", 2048))
+# A cached day plan is reused unless the day's weather category changed or its high or low
+# moved by more than this many °C.
+ITINERARY_TEMP_THRESHOLD = float(os.getenv("ITINERARY_TEMP_THRESHOLD", 3.0))
+
+
+def day_summary(day: dict) -> dict:
+    """Builds the summary a day plan depends on from one row of the Weather Agent's structured data."""
+    return {
+        "date": day["Date"],
+        "weather": day["Weather"],
+        "category": weather_category(day["Weather"]),
+        "high": float(day["High Temp (°C)"]),
+        "low": float(day["Low Temp (°C)"]),
+        "precipitation_mm": float(day.get("Precipitation (mm)", 0)),
+        "max_wind": float(day.get("Max Wind (m/s)", 0)),
+    }
+
+
+def summary_changed(old: dict, new: dict, temp_threshold: float = ITINERARY_TEMP_THRESHOLD) -> bool:
+    """Whether a day's weather changed enough that its plan should be written again."""
+    return (
+        old["category"] != new["category"]
+        or abs(old["high"] - new["high"]) > temp_threshold
+        or abs(old["low"] - new["low"]) > temp_threshold
+    )
+
+
+class ItinerarySegmentCache:
+    """
+    Two-tier (in-process LRU + SQLite) cache of single-day itinerary plans keyed by
+    ``(place, date)``.
+
+    Each entry is ``{"summary": {...}, "text": ..., "output_tokens": ...}``. ``summary`` is the
+    day's weather the plan was written for, so callers can decide whether it still fits.
+
+    Args:
+        path: The SQLite database file, or ``None`` to keep the cache in memory only.
+        max_entries: The size of the in-process LRU tier.
+        ttl: The time-to-live in seconds of a day plan.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = ITINERARY_SEGMENT_CACHE_SIZE, ttl: float = ITINERARY_SEGMENT_TTL):
+        self.ttl = ttl
+        disk = SQLiteCache(path, table="itinerary_segments") if path else None
+        self._cache = TieredCache(LRUCache(max_entries=max_entries), disk)
+
+    def _key(self, place: str, date: str) -> str:
+        return f"{normalize_place_name(place)}|{date}"
+
+    def get(self, place: str, date: str) -> Optional[dict]:
+        return self._cache.get(self._key(place, date))
+
+    def set(self, place: str, date: str, summary: dict, text: str, output_tokens: int = 0) -> None:
+        self._cache.set(self._key(place, date), {"summary": summary, "text": text, "output_tokens": output_tokens}, ttl=self.ttl)
+
+    def stats(self) -> dict[str, int]:
+        return self._cache.stats()
+
+
+_segment_cache: Optional[ItinerarySegmentCache] = None
+_segment_cache_lock = threading.Lock()
+
+
+def get_segment_cache() -> ItinerarySegmentCache:
+    """Returns the process-wide day plan cache, backed by ``itinerary.sqlite3`` in the cache directory."""
+    global _segment_cache
+    with _segment_cache_lock:
+        if _segment_cache is None:
+            _segment_cache = ItinerarySegmentCache(path=get_cache_path("itinerary.sqlite3"))
+        return _segment_cache
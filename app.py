@@ -1,13 +1,32 @@
 import streamlit as st
 import os
+import threading
 import warnings
-import pandas as pd # Import pandas for st.dataframe
 from dotenv import load_dotenv
 
 # Import agent functions
 from agent1.weather_agent import get_weather
-from agent2.precaution_agent import get_precautions
-from agent3.itinerary_agent import get_itinerary
+from common.clients import get_gemini_model, get_http_session
+from common.deadline import PIPELINE_DEADLINE, WEATHER_DEADLINE_SHARE, Deadline
+from common.metrics import REGISTRY
+from common.popularity import get_popularity_tracker
+from common.tracing import render_waterfall, trace_span
+from orchestrator import ITINERARY_AGENT, PRECAUTION_AGENT, format_weather_report, stream_followup_agents
+
+@st.cache_resource
+def load_config():
+    # Read once per process instead of on every rerun of this script.
+    load_dotenv()
+    # Suppress FutureWarning from google.generativeai
+    warnings.filterwarnings("ignore", category=FutureWarning)
+    return os.getenv("WEATHER_API_KEY"), os.getenv("GEMINI_API_KEY")
+
+@st.cache_resource
+def load_clients(gemini_api_key):
+    # Built once per process and shared by every session and rerun. The Gemini SDK is slow to
+    # import, so its model is built in the background rather than delaying the first render.
+    threading.Thread(target=get_gemini_model, args=(gemini_api_key,), daemon=True).start()
+    return get_http_session()
 
 def display_logs(logs, agent_name):
     with st.expander(f"Detailed logs for {agent_name}"):
@@ -28,6 +47,11 @@ def display_logs(logs, agent_name):
                 st.write(f"Details: {log_entry['details']}")
             st.markdown("---")
 
+        waterfall = render_waterfall(logs)
+        if waterfall:
+            st.markdown("**Timeline**")
+            st.code(waterfall, language=None)
+
 
 def run_agents(query, days, weather_api_key, gemini_api_key):
     st.session_state['weather_data_structured'] = [] # Renamed to clearly indicate structured data
@@ -40,10 +64,13 @@ def run_agents(query, days, weather_api_key, gemini_api_key):
     st.session_state['itinerary_logs'] = []
 
 
+    # One time budget for the whole plan; the Weather Agent may only use part of it.
+    deadline = Deadline(PIPELINE_DEADLINE)
+
     # Agent 1: Weather Agent
     with st.status("Getting weather information...", expanded=True, state="running") as status:
         st.write(f"Initiating Weather Agent for query: '{query}'")
-        structured_weather_data, extracted_place_name, weather_logs = get_weather(query, days, weather_api_key, gemini_api_key)
+        structured_weather_data, extracted_place_name, weather_logs = get_weather(query, days, weather_api_key, gemini_api_key, deadline.share(WEATHER_DEADLINE_SHARE))
         st.session_state['extracted_place_name'] = extracted_place_name
         st.session_state['weather_data_structured'] = structured_weather_data
         st.session_state['weather_logs'] = weather_logs
@@ -63,49 +90,50 @@ def run_agents(query, days, weather_api_key, gemini_api_key):
     if st.session_state['weather_report_error']: # Check for error from weather agent before proceeding
         return
 
-    # Agent 2: Precaution Agent
-    with st.status("Generating precautions...", expanded=True, state="running") as status:
-        st.write(f"Analyzing weather for {extracted_place_name} and generating precautions.")
-        
-        # Pass formatted weather report string to precaution agent if it expects string
-        # Or you can format structured_weather_data into a string here for the LLM prompt
-        formatted_weather_string_for_llm = ""
-        if st.session_state['weather_data_structured']:
-            formatted_weather_string_for_llm = f"Weather forecast for {extracted_place_name} for the next {days} day(s):\n"
-            for day_data in st.session_state['weather_data_structured']:
-                formatted_weather_string_for_llm += (
-                    f"  {day_data['Date']}: {day_data['Weather']}, "
-                    f"High: {day_data['High Temp (°C)']}°C, "
-                    f"Low: {day_data['Low Temp (°C)']}°C\n"
-                )
-        
-        precautions, precautions_logs = get_precautions(formatted_weather_string_for_llm, extracted_place_name, gemini_api_key)
-        st.session_state['precautions'] = precautions
-        st.session_state['precautions_logs'] = precautions_logs
-
-        display_logs(precautions_logs, "Precaution Agent")
+    get_popularity_tracker().record(extracted_place_name, days)
 
-        if precautions:
-            status.update(label="Precaution Agent: Precautions generated!", state="complete", expanded=False)
-        else:
-            status.update(label="Precaution Agent: No specific precautions generated.", state="complete", expanded=False)
+    # Agents 2 and 3 only need the weather report, so they run concurrently.
+    formatted_weather_string_for_llm = format_weather_report(st.session_state['weather_data_structured'], extracted_place_name, days)
 
-    # Agent 3: Itinerary Agent
-    with st.status("Generating travel itinerary...", expanded=True, state="running") as status:
+    precautions_status = st.status("Generating precautions...", expanded=True, state="running")
+    with precautions_status:
+        st.write(f"Analyzing weather for {extracted_place_name} and generating precautions.")
+        precautions_output = st.empty()
+    itinerary_status = st.status("Generating travel itinerary...", expanded=True, state="running")
+    with itinerary_status:
         st.write(f"Creating {days}-day itinerary for {extracted_place_name}.")
-        
-        # Pass formatted weather report string to itinerary agent
-        # Re-using the formatted string from precaution agent
-        itinerary, itinerary_logs = get_itinerary(formatted_weather_string_for_llm, extracted_place_name, days, gemini_api_key)
-        st.session_state['itinerary'] = itinerary
-        st.session_state['itinerary_logs'] = itinerary_logs
-
-        display_logs(itinerary_logs, "Itinerary Agent")
-
-        if itinerary:
-            status.update(label="Itinerary Agent: Itinerary generated!", state="complete", expanded=False)
+        itinerary_output = st.empty()
+
+    def on_agent_complete(agent, text, logs):
+        # Called on this script thread as each agent finishes, so each panel updates on its own.
+        if agent == PRECAUTION_AGENT:
+            st.session_state['precautions'] = text
+            st.session_state['precautions_logs'] = logs
+            with precautions_status:
+                display_logs(logs, "Precaution Agent")
+            if text:
+                precautions_status.update(label="Precaution Agent: Precautions generated!", state="complete", expanded=False)
+            else:
+                precautions_status.update(label="Precaution Agent: No specific precautions generated.", state="complete", expanded=False)
+        elif agent == ITINERARY_AGENT:
+            st.session_state['itinerary'] = text
+            st.session_state['itinerary_logs'] = logs
+            with itinerary_status:
+                display_logs(logs, "Itinerary Agent")
+            if text:
+                itinerary_status.update(label="Itinerary Agent: Itinerary generated!", state="complete", expanded=False)
+            else:
+                itinerary_status.update(label="Itinerary Agent: No itinerary generated.", state="complete", expanded=False)
+
+    # Render each agent's text as it streams in, then finalize its panel when it is done.
+    streamed_text = {PRECAUTION_AGENT: "", ITINERARY_AGENT: ""}
+    outputs = {PRECAUTION_AGENT: precautions_output, ITINERARY_AGENT: itinerary_output}
+    for agent, event, payload in stream_followup_agents(formatted_weather_string_for_llm, extracted_place_name, days, gemini_api_key, structured_weather_data=st.session_state['weather_data_structured'], deadline=deadline):
+        if event == "chunk":
+            streamed_text[agent] += payload
+            outputs[agent].markdown(streamed_text[agent])
         else:
-            status.update(label="Itinerary Agent: No itinerary generated.", state="complete", expanded=False)
+            on_agent_complete(agent, *payload)
 
 # --- Streamlit UI ---
 st.set_page_config(page_title="Multi-Agent Weather & Travel Assistant", layout="wide")
@@ -114,35 +142,38 @@ st.title("🌍 Multi-Agent Weather & Travel Assistant")
 st.markdown("Enter your travel query and number of days to get a weather forecast, travel precautions, and a detailed itinerary.")
 
 # Load API keys
-load_dotenv()
-weather_api_key = os.getenv("WEATHER_API_KEY")
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-
-# Suppress FutureWarning from google.generativeai
-warnings.filterwarnings("ignore", category=FutureWarning)
+weather_api_key, gemini_api_key = load_config()
 
 if not weather_api_key or not gemini_api_key:
     st.error("API keys not loaded. Please ensure WEATHER_API_KEY and GEMINI_API_KEY are set in your `.env` file.")
 else:
+    load_clients(gemini_api_key)
+
     # Input fields
     query = st.text_input("Your travel query (e.g., 'I am planning a trip to Kochi')", key="query_input")
     days = st.number_input("Number of days for the forecast and itinerary", min_value=1, max_value=7, value=3, key="days_input")
 
     if st.button("Get Travel Plan", key="get_plan_button"):
         if query and days:
-            run_agents(query, days, weather_api_key, gemini_api_key)
+            with trace_span("pipeline"):
+                run_agents(query, days, weather_api_key, gemini_api_key)
         else:
             st.warning("Please enter a travel query and number of days.")
 
+    with st.sidebar.expander("Performance metrics"):
+        for histogram in REGISTRY.to_dict()["histograms"].get("stage_latency_seconds", []):
+            st.write(f"**{histogram['labels']['stage']}**: p50 {histogram['p50'] * 1000:.0f} ms, p95 {histogram['p95'] * 1000:.0f} ms, p99 {histogram['p99'] * 1000:.0f} ms ({histogram['count']} calls)")
+        st.download_button("Download metrics (JSON)", REGISTRY.to_json(), file_name="metrics.json")
+        st.download_button("Download metrics (Prometheus)", REGISTRY.to_prometheus(), file_name="metrics.prom")
+
     # Display results
     if 'extracted_place_name' in st.session_state and st.session_state['extracted_place_name']:
         st.subheader(f"Travel Plan for {st.session_state['extracted_place_name']}")
         
         if st.session_state['weather_data_structured']: # Check if structured data exists
             st.markdown("### 🌤️ Weather Report")
-            # Convert list of dicts to DataFrame for better display
-            df_weather = pd.DataFrame(st.session_state['weather_data_structured'])
-            st.dataframe(df_weather)
+            # st.dataframe renders a list of dicts directly; no need to build a DataFrame here
+            st.dataframe(st.session_state['weather_data_structured'])
         elif st.session_state['weather_report_error']: # Display error if no structured data but error exists
             st.markdown("### 🌤️ Weather Report")
             st.error(st.session_state['weather_report_error'])
@@ -0,0 +1,190 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Iterator, Optional, TextIO
+
+from agent1.geocode_cache import normalize_place_name
+from common.metrics import quantile
+from common.scheduler import PRIORITY_BATCH, request_priority
+from orchestrator import ITINERARY_AGENT, PRECAUTION_AGENT, run_pipeline
+
+STAGES = ("weather", PRECAUTION_AGENT, ITINERARY_AGENT, "total")
+
+
+def record_key(query: str, days: int) -> str:
+    """Identifies a batch record, so a resumed batch can skip the ones already planned."""
+    return f"{normalize_place_name(query)}|{days}"
+
+
+def read_records(input_file: TextIO) -> Iterator[tuple[int, Optional[dict], str]]:
+    """
+    Reads ``{"query": ..., "days": ...}`` records from a JSONL file.
+
+    Yields:
+        ``(line_number, record, error)`` tuples; ``record`` is ``None`` and ``error`` is set for
+        lines that are not valid records.
+    """
+    for line_number, line in enumerate(input_file, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            query = record["query"]
+            days = int(record["days"])
+        except (ValueError, KeyError, TypeError) as e:
+            yield line_number, None, f"Invalid record: {e}"
+            continue
+        if not isinstance(query, str) or not query.strip() or days < 1:
+            yield line_number, None, "Invalid record: 'query' must be a non-empty string and 'days' at least 1"
+            continue
+        yield line_number, {"query": query, "days": days}, ""
+
+
+def load_completed(output_path: str) -> set[str]:
+    """Returns the keys of the records that already have a successful result in ``output_path``."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as output_file:
+        for line in output_file:
+            if not line.strip():
+                continue
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # A batch killed mid-write can leave a truncated last line.
+                continue
+            if result.get("status") == "ok":
+                completed.add(record_key(result["query"], result["days"]))
+    return completed
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, "rb") as existing_file:
+        existing_file.seek(0, os.SEEK_END)
+        if existing_file.tell() == 0:
+            return True
+        existing_file.seek(-1, os.SEEK_END)
+        return existing_file.read(1) == b"\n"
+
+
+def plan_record(line_number: int, record: dict, weather_api_key: str, gemini_api_key: str) -> dict:
+    """
+    Runs the pipeline for one record at batch priority, so interactive requests sharing the
+    upstream rate limits go first. The result is ``"ok"`` only if every agent succeeded; any
+    failure, including an agent that logged an error, makes it an ``"error"`` result.
+    """
+    try:
+        with request_priority(PRIORITY_BATCH):
+            result = run_pipeline(record["query"], record["days"], weather_api_key, gemini_api_key)
+    except Exception as e:
+        return {"line": line_number, **record, "status": "error", "error": str(e)}
+    if not result["place"]:
+        error = "Could not extract a location or fetch weather data for this query."
+    else:
+        # A failed agent still returns text (the error message), so only its logs tell it failed.
+        error = "; ".join(
+            f"{agent}: {entry['details']}"
+            for agent, logs in result["logs"].items()
+            for entry in logs
+            if entry["status"] == "error"
+        )
+    result = {"line": line_number, "status": "error" if error else "ok", **result}
+    if error:
+        result["error"] = error
+    return result
+
+
+def run_batch(
+    input_path: str,
+    output_path: str,
+    weather_api_key: str,
+    gemini_api_key: str,
+    workers: int = 4,
+    resume: bool = True,
+) -> dict:
+    """
+    Plans every record of a JSONL file with a bounded pool of workers.
+
+    Results are appended to ``output_path`` as JSONL as soon as each record finishes, including
+    failed records (``"status": "error"``), which never stop the batch. With ``resume``, records
+    that already have a successful result in ``output_path`` are skipped, so an interrupted batch
+    can simply be rerun, and failed records are tried again.
+
+    Args:
+        input_path: The JSONL file of ``{"query", "days"}`` records.
+        output_path: The JSONL file results are appended to.
+        weather_api_key: The OpenWeatherMap API key.
+        gemini_api_key: The Gemini API key.
+        workers: The number of records planned concurrently.
+        resume: Whether to skip records already completed in ``output_path``.
+
+    Returns:
+        The batch statistics (see ``summarize``).
+    """
+    completed = load_completed(output_path) if resume else set()
+    mode = "a" if resume else "w"
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+    timings = {stage: [] for stage in STAGES}
+    start = time.perf_counter()
+
+    with open(input_path, encoding="utf-8") as input_file, open(output_path, mode, encoding="utf-8") as output_file, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        if mode == "a" and not _ends_with_newline(output_path):
+            # Start on a fresh line in case the previous run died in the middle of a write.
+            output_file.write("\n")
+
+        def write(result: dict) -> None:
+            counts[result["status"]] += 1
+            for stage, seconds in result.get("timings", {}).items():
+                timings[stage].append(seconds)
+            output_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output_file.flush()
+
+        pending = set()
+        for line_number, record, error in read_records(input_file):
+            if record is None:
+                write({"line": line_number, "status": "error", "error": error})
+                continue
+            key = record_key(record["query"], record["days"])
+            if key in completed:
+                counts["skipped"] += 1
+                continue
+            completed.add(key)
+            # Keep at most two records per worker in flight so huge inputs are not read up front.
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write(future.result())
+            pending.add(executor.submit(plan_record, line_number, record, weather_api_key, gemini_api_key))
+        for future in as_completed(pending):
+            write(future.result())
+
+    return summarize(counts, timings, time.perf_counter() - start)
+
+
+def summarize(counts: dict[str, int], timings: dict[str, list[float]], elapsed: float) -> dict:
+    """Builds the batch statistics: record counts, throughput and per-stage latency percentiles."""
+    processed = counts["ok"] + counts["error"]
+    stats = {**counts, "elapsed_seconds": round(elapsed, 3), "records_per_second": round(processed / elapsed, 3) if elapsed else 0.0}
+    stats["latency_seconds"] = {
+        stage: {
+            "count": len(values),
+            "mean": round(sum(values) / len(values), 3) if values else 0.0,
+            "p50": round(quantile(values, 0.5), 3),
+            "p95": round(quantile(values, 0.95), 3),
+            "max": round(max(values), 3) if values else 0.0,
+        }
+        for stage, values in timings.items()
+    }
+    return stats
+
+
+def print_summary(stats: dict, file: TextIO = sys.stdout) -> None:
+    print(f"Processed {stats['ok'] + stats['error']} record(s) in {stats['elapsed_seconds']}s "
+          f"({stats['records_per_second']} records/s): {stats['ok']} ok, {stats['error']} failed, {stats['skipped']} skipped.", file=file)
+    print(f"{'Stage':<12}{'count':>7}{'mean':>9}{'p50':>9}{'p95':>9}{'max':>9}", file=file)
+    for stage, latency in stats["latency_seconds"].items():
+        print(f"{stage:<12}{latency['count']:>7}{latency['mean']:>9}{latency['p50']:>9}{latency['p95']:>9}{latency['max']:>9}", file=file)
@@ -0,0 +1,210 @@
+import hashlib
+import random
+import re
+import threading
+import time
+from typing import Optional
+
+import requests
+
+from agent3.itinerary_agent import DAY_MARKER_INSTRUCTION
+
+
+class LatencyModel:
+    """
+    A latency distribution in milliseconds.
+
+    Args:
+        kind: ``"constant"`` (``mean_ms``), ``"uniform"`` (``min_ms`` to ``max_ms``) or
+            ``"lognormal"`` (median ``mean_ms``, spread ``sigma``), the latter giving a realistic long tail.
+        rng: The random generator, so scenarios are reproducible.
+    """
+
+    def __init__(self, kind: str = "constant", mean_ms: float = 0.0, min_ms: float = 0.0, max_ms: float = 0.0, sigma: float = 0.5, rng: Optional[random.Random] = None):
+        self.kind = kind
+        self.mean_ms = mean_ms
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.sigma = sigma
+        self.rng = rng or random.Random(0)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Optional[dict], rng: random.Random) -> "LatencyModel":
+        return cls(rng=rng, **(config or {}))
+
+    def sample(self) -> float:
+        """Returns a latency in seconds."""
+        with self._lock:
+            if self.kind == "uniform":
+                value = self.rng.uniform(self.min_ms, self.max_ms)
+            elif self.kind == "lognormal":
+                value = self.rng.lognormvariate(0, self.sigma) * self.mean_ms
+            else:
+                value = self.mean_ms
+        return value / 1000
+
+    def sleep(self) -> None:
+        time.sleep(self.sample())
+
+
+class FakeUpstream:
+    """Latency and error-rate settings shared by the fake services."""
+
+    def __init__(self, config: Optional[dict], rng: random.Random):
+        config = config or {}
+        self.latency = LatencyModel.from_config(config.get("latency"), rng)
+        self.error_rate = config.get("error_rate", 0.0)
+        self.rng = rng
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def call(self) -> bool:
+        """Sleeps for one sampled latency and returns whether this call should fail."""
+        with self._lock:
+            self.calls += 1
+            failed = self.rng.random() < self.error_rate
+        self.latency.sleep()
+        return failed
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, payload, url: str):
+        self.status_code = status_code
+        self._payload = payload
+        self.url = url
+        self.content = repr(payload).encode("utf-8")
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Server Error for url: {self.url}", response=self)
+
+    def json(self):
+        return self._payload
+
+
+class FakeHTTPSession:
+    """
+    Stands in for the shared ``requests.Session`` and answers Nominatim search and OpenWeatherMap
+    forecast requests locally.
+
+    Args:
+        nominatim: ``{"latency": {...}, "error_rate": float, "results": int}``.
+        openweathermap: ``{"latency": {...}, "error_rate": float, "slots": int}``; ``slots`` is the number
+            of 3-hour entries in the forecast list (40 for the real 5-day API).
+        rng: The random generator.
+    """
+
+    def __init__(self, nominatim: Optional[dict] = None, openweathermap: Optional[dict] = None, rng: Optional[random.Random] = None):
+        rng = rng or random.Random(0)
+        self.nominatim = FakeUpstream(nominatim, rng)
+        self.openweathermap = FakeUpstream(openweathermap, rng)
+        self.nominatim_results = (nominatim or {}).get("results", 1)
+        self.forecast_slots = (openweathermap or {}).get("slots", 40)
+
+    def get(self, url: str, params: Optional[dict] = None, timeout=None, **kwargs) -> FakeResponse:
+        params = params or {}
+        if "nominatim" in url:
+            if self.nominatim.call():
+                return FakeResponse(503, {}, url)
+            return FakeResponse(200, self._places(params.get("q", "")), url)
+        if "openweathermap" in url:
+            if self.openweathermap.call():
+                raise requests.exceptions.ConnectionError(f"Fake connection error for url: {url}")
+            return FakeResponse(200, self._forecast(float(params.get("lat", 0)), float(params.get("lon", 0))), url)
+        raise requests.exceptions.InvalidURL(f"No fake upstream for {url}")
+
+    def _places(self, query: str) -> list[dict]:
+        digest = int(hashlib.sha256(query.encode("utf-8")).hexdigest(), 16)
+        lat, lon = (digest % 18000) / 100 - 90, (digest // 18000 % 36000) / 100 - 180
+        return [
+            {"lat": f"{lat + i * 0.01:.4f}", "lon": f"{lon:.4f}", "display_name": f"{query} {i}", "importance": 0.5}
+            for i in range(self.nominatim_results)
+        ]
+
+    def _forecast(self, lat: float, lon: float) -> dict:
+        start = int(time.time() // 10800) * 10800
+        descriptions = ("clear sky", "few clouds", "light rain", "overcast clouds")
+        return {
+            "city": {"name": "Fake City", "timezone": int(lon / 15) * 3600},
+            "list": [
+                {
+                    "dt": start + i * 10800,
+                    "main": {"temp": 20 + (i % 8) + lat / 90},
+                    "weather": [{"description": descriptions[(i // 4) % len(descriptions)]}],
+                    "wind": {"speed": 2 + i % 5},
+                    "rain": {"3h": 0.5} if i % 6 == 0 else None,
+                }
+                for i in range(self.forecast_slots)
+            ],
+        }
+
+
+class _Usage:
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class _Chunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _StreamResponse:
+    def __init__(self, model: "FakeGeminiModel", prompt: str):
+        self._model = model
+        self._prompt = prompt
+        self.usage_metadata = None
+
+    def __iter__(self):
+        chunks = self._model.chunks(self._prompt)
+        for chunk in chunks:
+            self._model.inter_chunk.sleep()
+            yield _Chunk(chunk)
+        self.usage_metadata = _Usage(len(self._prompt) // 4, sum(len(chunk) for chunk in chunks) // 4)
+
+
+class _Response:
+    def __init__(self, text: str, prompt: str):
+        self.text = text
+        self.usage_metadata = _Usage(len(prompt) // 4, len(text) // 4)
+
+
+class FakeGeminiModel:
+    """
+    Stands in for ``genai.GenerativeModel``: ``generate_content`` waits for the configured time to
+    first token and, when streaming, for ``inter_chunk`` latency between chunks.
+
+    Args:
+        config: ``{"latency": {...}, "inter_chunk_latency": {...}, "error_rate": float,
+            "output_chars": int, "chunks": int}``.
+        rng: The random generator.
+    """
+
+    def __init__(self, config: Optional[dict] = None, rng: Optional[random.Random] = None):
+        config = config or {}
+        rng = rng or random.Random(0)
+        self.upstream = FakeUpstream(config, rng)
+        self.inter_chunk = LatencyModel.from_config(config.get("inter_chunk_latency"), rng)
+        self.output_chars = config.get("output_chars", 2000)
+        self.chunk_count = config.get("chunks", 8)
+
+    def chunks(self, prompt: str) -> list[str]:
+        if "extract ONLY the name of the location" in prompt:
+            return [prompt.rsplit("'", 2)[-2].split()[-1]]
+        size = max(1, self.output_chars // self.chunk_count)
+        if DAY_MARKER_INSTRUCTION in prompt:
+            # A multi-day itinerary: split the same output between the requested days, each after its marker line.
+            dates = re.findall(r"^- (\S+): ", prompt, re.MULTILINE)
+            per_day = max(1, self.chunk_count // len(dates))
+            return [chunk for date in dates for chunk in [f"\n=== {date} ===\n"] + ["x" * size] * per_day]
+        return ["x" * size] * self.chunk_count
+
+    def generate_content(self, prompt: str, stream: bool = False, request_options: Optional[dict] = None):
+        if self.upstream.call():
+            raise RuntimeError("503 The model is overloaded (fake Gemini error).")
+        if stream:
+            return _StreamResponse(self, prompt)
+        return _Response("".join(self.chunks(prompt)), prompt)
@@ -0,0 +1,127 @@
+"""
+Cold-start profile of the entry points, checked against ``import_budget.json``.
+
+Each module is imported in a fresh interpreter with ``python -X importtime``. The report shows
+the total import time, the heaviest packages pulled in, and whether any module the budget
+forbids at start-up (e.g. the Gemini SDK or pandas) was imported. The Streamlit page's
+first-render time is measured with ``streamlit.testing``.
+
+Usage:
+    python -m benchmarks.import_time              # profile and compare with the budget
+    python -m benchmarks.import_time -o report.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+BUDGET_PATH = os.path.join(BENCHMARK_DIR, "import_budget.json")
+# Entry in the budget whose time is the Streamlit page's first render rather than an import.
+APP_FIRST_RENDER = "app:first_render"
+FIRST_RENDER_SCRIPT = """
+import time
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+AppTest.from_file("app.py", default_timeout=60).run()
+print(time.perf_counter() - start)
+"""
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, float, float]]:
+    """Parses ``-X importtime`` output into ``(module, depth, self_ms, cumulative_ms)`` rows."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), depth, int(self_us) / 1000, int(cumulative_us) / 1000))
+    return rows
+
+
+def profile_import(module: str, runs: int = 3) -> dict:
+    """Imports ``module`` in ``runs`` fresh interpreters and reports the fastest run."""
+    best = None
+    for _ in range(runs):
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=REPO_DIR, capture_output=True, text=True, check=True,
+        )
+        rows = parse_importtime(process.stderr)
+        # A module's imports are printed right before it, one level deeper; interpreter
+        # start-up imports come earlier at depth 0.
+        end = max(i for i, (name, depth, _, _) in enumerate(rows) if name == module and depth == 0)
+        start = end
+        while start > 0 and rows[start - 1][1] > 0:
+            start -= 1
+        if best is None or rows[end][3] < best[0]:
+            best = (rows[end][3], rows[start:end])
+    total, rows = best
+    packages = {}
+    for name, _, _, cumulative in rows:
+        if "." not in name and name != module:
+            packages[name] = max(packages.get(name, 0.0), cumulative)
+    heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:8]
+    return {
+        "total_ms": round(total, 1),
+        "heaviest": {name: round(cumulative, 1) for name, cumulative in heaviest},
+        "modules": sorted({name for name, _, _, _ in rows}),
+    }
+
+
+def profile_first_render(runs: int = 3) -> dict:
+    """
+    Renders ``app.py`` once per fresh interpreter (with placeholder API keys) and reports the
+    fastest run. Streamlit itself is imported before timing starts, as it is in a running server.
+    """
+    environment = {**os.environ, "WEATHER_API_KEY": os.getenv("WEATHER_API_KEY", "placeholder"), "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY", "placeholder")}
+    timings = []
+    for _ in range(runs):
+        process = subprocess.run([sys.executable, "-c", FIRST_RENDER_SCRIPT], cwd=REPO_DIR, env=environment, capture_output=True, text=True, check=True)
+        timings.append(float(process.stdout.strip().splitlines()[-1]) * 1000)
+    return {"total_ms": round(min(timings), 1), "heaviest": {}, "modules": []}
+
+
+def check(name: str, result: dict, budget: dict) -> list[str]:
+    """Returns the budget violations of one entry point."""
+    violations = []
+    if result["total_ms"] > budget["budget_ms"]:
+        violations.append(f"{name}: {result['total_ms']} ms > budget {budget['budget_ms']} ms")
+    for module in budget.get("forbidden", []):
+        if module in result["modules"]:
+            violations.append(f"{name}: imports '{module}' at start-up")
+    return violations
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Profile the import time of the entry points against a budget")
+    parser.add_argument("--budget", default=BUDGET_PATH, help="Import-time budget (JSON)")
+    parser.add_argument("-r", "--runs", type=int, default=3, help="Fresh interpreters per entry point; the fastest counts (default: 3)")
+    parser.add_argument("-o", "--output", help="Also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    with open(args.budget, encoding="utf-8") as budget_file:
+        budgets = json.load(budget_file)
+
+    report, violations = {}, []
+    print(f"{'Entry point':<24}{'ms':>9}{'budget':>9}  heaviest imports (cumulative ms)")
+    for name, budget in budgets.items():
+        result = profile_first_render(args.runs) if name == APP_FIRST_RENDER else profile_import(name, args.runs)
+        violations.extend(check(name, result, budget))
+        heaviest = ", ".join(f"{package} {ms}" for package, ms in list(result["heaviest"].items())[:4])
+        print(f"{name:<24}{result['total_ms']:>9}{budget['budget_ms']:>9}  {heaviest}")
+        report[name] = {key: value for key, value in result.items() if key != "modules"}
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+    for violation in violations:
+        print(f"OVER BUDGET {violation}")
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
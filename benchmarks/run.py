@@ -0,0 +1,287 @@
+"""
+Offline benchmark suite for the weather -> precautions -> itinerary pipeline.
+
+Nominatim, OpenWeatherMap and Gemini are replaced by in-process fakes with configurable latency
+distributions, error rates and payload sizes (see ``scenarios.json``), so the numbers measure this
+code rather than the network. Results are compared against ``baseline.json``.
+
+Usage:
+    python -m benchmarks.run                       # run all scenarios, compare with the baseline
+    python -m benchmarks.run -s pipeline_cold      # run selected scenarios
+    python -m benchmarks.run --update-baseline     # record the current numbers as the baseline
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import agent1.forecast_cache as forecast_cache_module
+import agent1.geocode_cache as geocode_cache_module
+import agent3.segment_cache as segment_cache_module
+import common.llm_cache as llm_cache_module
+import common.popularity as popularity_module
+from agent1.forecast_cache import ForecastCache
+from agent1.geocode_cache import GeocodeCache
+from agent1.location_extractor import GAZETTEER_PATH
+from agent1.weather_agent import get_weather
+from agent2.precaution_agent import get_precautions
+from agent3.itinerary_agent import get_itinerary, get_itinerary_by_day
+from agent3.segment_cache import ItinerarySegmentCache
+from benchmarks.fakes import FakeGeminiModel, FakeHTTPSession
+from common.cache import LRUCache
+from common.clients import install_gemini_model_factory, install_http_session
+from common.deadline import Deadline
+from common.llm_cache import LLMCache
+from common.metrics import REGISTRY, quantile
+from common.popularity import PopularityTracker
+from common.scheduler import Scheduler, UpstreamLimiter, install_scheduler
+from orchestrator import format_weather_report, run_pipeline
+from prefetch import run_prefetch_cycle
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS_PATH = os.path.join(BENCHMARK_DIR, "scenarios.json")
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline.json")
+FAKE_KEY = "offline-benchmark-key"
+# Absolute slack added to the relative tolerance so tiny timings do not flap.
+LATENCY_SLACK_MS = 20.0
+MEMORY_SLACK_KB = 256.0
+
+
+def _merge(base: dict, override: dict) -> dict:
+    merged = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def load_scenarios(path: str = SCENARIOS_PATH) -> list[dict]:
+    with open(path, encoding="utf-8") as scenarios_file:
+        config = json.load(scenarios_file)
+    return [_merge(config.get("defaults", {}), scenario) for scenario in config["scenarios"]]
+
+
+def _destinations() -> list[str]:
+    with open(GAZETTEER_PATH, encoding="utf-8") as gazetteer_file:
+        return [line.strip() for line in gazetteer_file if line.strip() and not line.startswith("#")]
+
+
+def install_fakes(scenario: dict) -> None:
+    """
+    Points the shared clients at fresh fakes and gives every cache a fresh in-memory instance.
+    Upstreams are only rate limited when the scenario has ``rate_limits``
+    (``{"nominatim": {"rate": ..., "burst": ...}, ...}``).
+    """
+    rng = random.Random(scenario["seed"])
+    install_http_session(FakeHTTPSession(scenario["nominatim"], scenario["openweathermap"], rng))
+    model = FakeGeminiModel(scenario["gemini"], rng)
+    install_gemini_model_factory(lambda api_key, model_name: model)
+    limits = scenario.get("rate_limits", {})
+    install_scheduler(Scheduler({name: UpstreamLimiter(name, **config) for name, config in limits.items()}))
+
+    size = 4096 if scenario["caches"] else 0
+    geocode_cache_module._geocode_cache = GeocodeCache(max_entries=size)
+    forecast_cache_module._forecast_cache = ForecastCache(max_entries=size)
+    llm_cache_module._llm_cache = LLMCache(LRUCache(max_entries=size), bypass=not scenario["caches"])
+    popularity_module._popularity_tracker = PopularityTracker()
+    segment_cache_module._segment_cache = ItinerarySegmentCache(max_entries=size)
+
+
+def uninstall_fakes() -> None:
+    install_http_session(None)
+    install_gemini_model_factory(None)
+    install_scheduler(None)
+    geocode_cache_module._geocode_cache = None
+    forecast_cache_module._forecast_cache = None
+    llm_cache_module._llm_cache = None
+    popularity_module._popularity_tracker = None
+    segment_cache_module._segment_cache = None
+
+
+def _has_error(logs: list[dict]) -> bool:
+    return any(entry["status"] == "error" for entry in logs)
+
+
+def _weather_report(place: str, days: int) -> str:
+    report = f"Weather forecast for {place} for the next {days} day(s):\n"
+    for day in range(days):
+        report += f"  2025-01-0{day + 1}: Light rain, High: 29.50°C, Low: 23.10°C\n"
+    return report
+
+
+def _daily_weather(place: str, days: int, refresh: int) -> list[dict]:
+    """
+    Structured forecast as of the ``refresh``-th forecast update: temperatures drift by up to
+    1°C between updates and every other update turns the last day from rain to clear sky.
+    """
+    drift = (refresh % 3) * 0.5
+    return [
+        {
+            "Date": f"2025-01-0{day + 1}",
+            "Weather": "Clear sky" if day == days - 1 and refresh % 2 else "Light rain",
+            "High Temp (°C)": f"{29.5 + drift:.2f}",
+            "Low Temp (°C)": f"{23.1 + drift:.2f}",
+            "Precipitation (mm)": "1.5",
+            "Max Wind (m/s)": "4.0",
+        }
+        for day in range(days)
+    ]
+
+
+def make_request(target: str, place: str, days: int, refresh: int = 0, deadline: Optional[float] = None):
+    """
+    Returns a zero-argument callable that runs one request and returns whether it failed.
+    ``refresh`` counts the forecast updates since the destination was first requested, and
+    ``deadline`` is the pipeline's time budget in seconds (``PIPELINE_DEADLINE`` by default).
+    """
+    query = f"I am planning a trip to {place}"
+    if target == "weather":
+        return lambda: not get_weather(query, days, FAKE_KEY, FAKE_KEY)[1]
+    if target == "precautions":
+        return lambda: _has_error(get_precautions(_weather_report(place, days), place, FAKE_KEY)[1])
+    if target == "itinerary":
+        return lambda: _has_error(get_itinerary(_weather_report(place, days), place, days, FAKE_KEY)[1])
+    if target == "itinerary_refresh":
+        return lambda: _has_error(get_itinerary(format_weather_report(_daily_weather(place, days, refresh), place, days), place, days, FAKE_KEY)[1])
+    if target == "itinerary_per_day":
+        return lambda: _has_error(get_itinerary_by_day(_daily_weather(place, days, refresh), place, days, FAKE_KEY)[1])
+    if target == "pipeline":
+        def run() -> bool:
+            result = run_pipeline(query, days, FAKE_KEY, FAKE_KEY, deadline=Deadline(deadline) if deadline else None)
+            return not result["place"] or any(_has_error(logs) for logs in result["logs"].values())
+        return run
+    raise ValueError(f"Unknown benchmark target: '{target}'")
+
+
+def run_scenario(scenario: dict) -> dict:
+    """Runs one scenario at its configured concurrency and returns its throughput, latency and memory."""
+    destinations = _destinations()
+    places = [destinations[i % len(destinations)] for i in range(scenario["distinct_queries"])]
+    requests_to_run = [
+        make_request(scenario["target"], places[i % len(places)], scenario["days"], refresh=i // len(places), deadline=scenario.get("deadline"))
+        for i in range(scenario["requests"])
+    ]
+
+    def timed(request) -> tuple[float, bool]:
+        start = time.perf_counter()
+        try:
+            failed = request()
+        except Exception:
+            failed = True
+        return time.perf_counter() - start, failed
+
+    def run_all() -> tuple[list[tuple[float, bool]], float]:
+        install_fakes(scenario)
+        try:
+            if scenario.get("prefetch"):
+                # Warm the caches for every destination before the timed run, as the prefetcher
+                # would after a forecast update.
+                tracker = popularity_module.get_popularity_tracker()
+                for place in places:
+                    tracker.record(place, scenario["days"])
+                run_prefetch_cycle(FAKE_KEY, FAKE_KEY, top_n=len(places), days_per_place=1, workers=scenario["concurrency"], budget={"nominatim": 10**6, "openweathermap": 10**6, "gemini": 10**6})
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=scenario["concurrency"]) as executor:
+                outcomes = list(executor.map(timed, requests_to_run))
+            return outcomes, time.perf_counter() - start
+        finally:
+            uninstall_fakes()
+
+    # tracemalloc slows allocation-heavy code several times over, so latency and memory are
+    # measured in two separate runs of the same scenario.
+    REGISTRY.reset()
+    outcomes, elapsed = run_all()
+    stage_histograms = REGISTRY.to_dict()["histograms"].get("stage_latency_seconds", [])
+    tracemalloc.start()
+    try:
+        run_all()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    latencies = [latency for latency, _ in outcomes]
+    stages = {
+        histogram["labels"]["stage"]: round(histogram["p50"] * 1000, 2)
+        for histogram in stage_histograms
+    }
+    return {
+        "requests": len(outcomes),
+        "errors": sum(failed for _, failed in outcomes),
+        "throughput_rps": round(len(outcomes) / elapsed, 2),
+        "p50_ms": round(quantile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(quantile(latencies, 0.99) * 1000, 2),
+        "peak_memory_kb": round(peak_memory / 1024, 1),
+        "stage_p50_ms": stages,
+    }
+
+
+def compare(name: str, result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Returns the regressions of a scenario's result against its baseline entry."""
+    regressions = []
+    for metric in ("p50_ms", "p99_ms"):
+        limit = baseline[metric] * (1 + tolerance) + LATENCY_SLACK_MS
+        if result[metric] > limit:
+            regressions.append(f"{name}: {metric} {result[metric]} > {limit:.2f} (baseline {baseline[metric]})")
+    floor = baseline["throughput_rps"] * (1 - tolerance)
+    if result["throughput_rps"] < floor:
+        regressions.append(f"{name}: throughput_rps {result['throughput_rps']} < {floor:.2f} (baseline {baseline['throughput_rps']})")
+    memory_limit = baseline["peak_memory_kb"] * (1 + tolerance) + MEMORY_SLACK_KB
+    if result["peak_memory_kb"] > memory_limit:
+        regressions.append(f"{name}: peak_memory_kb {result['peak_memory_kb']} > {memory_limit:.1f} (baseline {baseline['peak_memory_kb']})")
+    return regressions
+
+
+def print_results(results: dict[str, dict], baseline: dict[str, dict]) -> None:
+    print(f"{'Scenario':<20}{'requests':>9}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'peak KB':>10}{'base p99':>10}")
+    for name, result in results.items():
+        base_p99 = baseline.get(name, {}).get("p99_ms", "-")
+        print(f"{name:<20}{result['requests']:>9}{result['errors']:>8}{result['throughput_rps']:>10}{result['p50_ms']:>10}"
+              f"{result['p99_ms']:>10}{result['peak_memory_kb']:>10}{base_p99:>10}")
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks with fake Nominatim, OpenWeatherMap and Gemini upstreams")
+    parser.add_argument("-s", "--scenario", action="append", help="Scenario name to run (repeatable; default: all)")
+    parser.add_argument("--scenarios", default=SCENARIOS_PATH, help="Scenario definitions (JSON)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline results (JSON)")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results to the baseline file instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed relative regression (default: 0.5)")
+    parser.add_argument("-o", "--output", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    scenarios = [scenario for scenario in load_scenarios(args.scenarios) if not args.scenario or scenario["name"] in args.scenario]
+    results = {scenario["name"]: run_scenario(scenario) for scenario in scenarios}
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write("\n")
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    regressions = [regression for name, result in results.items() if name in baseline for regression in compare(name, result, baseline[name], args.tolerance)]
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
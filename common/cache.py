@@ -0,0 +1,214 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+DEFAULT_CACHE_DIR = ".cache"
+
+
+def get_cache_path(filename: str) -> str:
+    """
+    Returns the on-disk location for a cache database, creating the cache directory if needed.
+
+    The directory defaults to ``.cache`` and can be changed with the ``WEATHERWISE_CACHE_DIR``
+    environment variable.
+    """
+    cache_dir = os.getenv("WEATHERWISE_CACHE_DIR", DEFAULT_CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, filename)
+
+
+class LRUCache:
+    """
+    A thread-safe in-process LRU cache with optional per-entry expiry.
+
+    Args:
+        max_entries: The number of entries kept before the least recently used one is evicted.
+        ttl: The default time-to-live in seconds. ``None`` means entries never expire.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[Any, Optional[float]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_entry(self, key: str) -> Optional[tuple[Any, Optional[float]]]:
+        """Returns ``(value, expires_at)`` for a live entry, or ``None`` on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def get(self, key: str) -> Any:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, expires_at: Optional[float] = None) -> None:
+        if expires_at is None:
+            ttl = self.ttl if ttl is None else ttl
+            expires_at = None if ttl is None else time.time() + ttl
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """
+    A persistent key/value cache stored in a SQLite table. Values must be JSON-serializable.
+
+    Args:
+        path: The SQLite database file.
+        table: The table name, so several caches can share one database file.
+        ttl: The default time-to-live in seconds. ``None`` means entries never expire.
+        max_entries: Optional cap on the number of rows; the oldest rows are evicted first.
+    """
+
+    def __init__(self, path: str, table: str = "cache", ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, expires_at REAL)"
+            )
+
+    def get_entry(self, key: str) -> Optional[tuple[Any, Optional[float]]]:
+        """Returns ``(value, expires_at)`` for a live entry, or ``None`` on a miss."""
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] <= time.time():
+                with self._conn:
+                    self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+        return json.loads(row[0]), row[1]
+
+    def get(self, key: str) -> Any:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, expires_at: Optional[float] = None) -> None:
+        now = time.time()
+        if expires_at is None:
+            ttl = self.ttl if ttl is None else ttl
+            expires_at = None if ttl is None else now + ttl
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at, expires_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, expires_at),
+            )
+            if self.max_entries is not None:
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+
+    def delete(self, key: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def purge_expired(self) -> int:
+        """Deletes expired rows and returns how many were removed."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            )
+            return cursor.rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class TieredCache:
+    """
+    An in-process LRU in front of an optional persistent backend.
+
+    Reads check memory first and promote disk hits into memory with their remaining lifetime;
+    writes go to both tiers. Hit and miss counters are kept per tier.
+    """
+
+    def __init__(self, memory: LRUCache, disk: Optional[SQLiteCache] = None):
+        self.memory = memory
+        self.disk = disk
+        self._stats_lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def _count(self, counter: str) -> None:
+        with self._stats_lock:
+            self._stats[counter] += 1
+
+    def get_entry(self, key: str) -> Optional[tuple[Any, Optional[float]]]:
+        entry = self.memory.get_entry(key)
+        if entry is not None:
+            self._count("memory_hits")
+            return entry
+        if self.disk is not None:
+            entry = self.disk.get_entry(key)
+            if entry is not None:
+                self._count("disk_hits")
+                self.memory.set(key, entry[0], expires_at=entry[1])
+                return entry
+        self._count("misses")
+        return None
+
+    def get(self, key: str) -> Any:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, expires_at: Optional[float] = None) -> None:
+        if expires_at is None and ttl is not None:
+            expires_at = time.time() + ttl
+        # Without an explicit lifetime each tier falls back to its own default TTL.
+        self.memory.set(key, value, expires_at=expires_at)
+        if self.disk is not None:
+            self.disk.set(key, value, expires_at=expires_at)
+
+    def delete(self, key: str) -> None:
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> dict[str, int]:
+        """Returns a snapshot of the hit/miss counters."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["memory_entries"] = len(self.memory)
+        return stats
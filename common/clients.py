@@ -0,0 +1,94 @@
+import functools
+import os
+import threading
+from typing import Any, Callable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+GEMINI_MODEL_NAME = "gemini-2.5-flash"
+USER_AGENT = "Multi-Agent-Weather-App/1.0"
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3.05))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 10))
+# Keep-alive connections kept per host (Nominatim, OpenWeatherMap).
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 10))
+# Retries of connections that could not be established, which never reached the upstream.
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 2))
+HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", 0.5))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", 60))
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+# Replaces the real Gemini model when set, e.g. with an offline fake in the benchmarks.
+_gemini_model_factory: Optional[Callable[[str, str], Any]] = None
+
+
+def build_http_session() -> requests.Session:
+    """
+    Builds a ``requests.Session`` with a bounded keep-alive pool per host that retries, with
+    exponential backoff, only connections that could not be established.
+
+    Every request that reaches Nominatim or OpenWeatherMap must be granted by the upstream
+    scheduler, so the session never re-sends one itself: 5xx and 429 responses (even with
+    ``Retry-After``) and read errors are returned to the caller, where ``upstream_call`` pauses
+    the upstream on a 429 and the agents fall back or fail.
+    """
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        connect=HTTP_MAX_RETRIES,
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        allowed_methods=frozenset({"GET"}),
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_MAXSIZE, pool_block=True, max_retries=retry)
+    session = requests.Session()
+    session.headers.update({"User-Agent": USER_AGENT})
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_http_session() -> requests.Session:
+    """Returns the process-wide pooled HTTP session shared by all agents."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = build_http_session()
+        return _session
+
+
+def install_http_session(session: Optional[Any]) -> None:
+    """Replaces the shared HTTP session (``None`` restores a real one on next use)."""
+    global _session
+    with _session_lock:
+        _session = session
+
+
+def install_gemini_model_factory(factory: Optional[Callable[[str, str], Any]]) -> None:
+    """Makes ``get_gemini_model`` return ``factory(api_key, model_name)`` instead (``None`` restores Gemini)."""
+    global _gemini_model_factory
+    _gemini_model_factory = factory
+
+
+def get_gemini_model(api_key: str, model_name: str = GEMINI_MODEL_NAME) -> Any:
+    """
+    Returns a Gemini model object, configured and built once per process for each API key and model.
+    """
+    if _gemini_model_factory is not None:
+        return _gemini_model_factory(api_key, model_name)
+    return _build_gemini_model(api_key, model_name)
+
+
+@functools.lru_cache(maxsize=8)
+def _build_gemini_model(api_key: str, model_name: str) -> Any:
+    # The SDK takes about a second to import, so it is only loaded when a model is first needed.
+    import google.generativeai as genai
+
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name)
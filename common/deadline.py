@@ -0,0 +1,238 @@
+import contextvars
+import itertools
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, Optional, TypeVar
+
+from common.metrics import REGISTRY
+from common.tracing import current_span
+
+T = TypeVar("T")
+
+# End-to-end time budget of one plan, in seconds.
+PIPELINE_DEADLINE = float(os.getenv("PIPELINE_DEADLINE", 45))
+# Share of a plan's remaining budget the Weather Agent may use; the rest is left to the LLM agents.
+WEATHER_DEADLINE_SHARE = float(os.getenv("WEATHER_DEADLINE_SHARE", 0.4))
+# Shortest timeout handed to an upstream call, so a nearly spent budget still gets one quick try.
+MIN_TIMEOUT = 0.5
+# A duplicate request is sent once an upstream call runs longer than this quantile of its
+# recent latencies, after at least HEDGE_MIN_SAMPLES of them have been observed.
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", 0.95))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "1").lower() not in ("0", "false", "no")
+
+REGISTRY.describe("upstream_latency_seconds", "Latency of successful upstream calls by kind (time to first chunk for streams), used to decide when to hedge.")
+REGISTRY.describe("hedged_requests_total", "Duplicate upstream requests sent because the first one was slower than usual.")
+REGISTRY.describe("hedges_skipped_total", "Duplicate upstream requests not sent because the upstream had no free rate-limit slot.")
+REGISTRY.describe("deadline_exceeded_total", "Upstream calls abandoned because the request's time budget ran out.")
+
+# Runs upstream calls that are bounded by a deadline or hedged; threads left waiting on an
+# abandoned call end with that call's own timeout.
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("UPSTREAM_CALL_WORKERS", 64)), thread_name_prefix="upstream")
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request's time budget runs out before an upstream answers."""
+
+
+class Deadline:
+    """
+    The point in time by which a request must be answered, shared by every stage of a plan so
+    each one can size its timeouts from what is left.
+
+    Args:
+        seconds: The budget from now, or ``None`` for no deadline.
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    @property
+    def bounded(self) -> bool:
+        return self.expires_at is not None
+
+    def remaining(self) -> Optional[float]:
+        """Returns the seconds left (never negative), or ``None`` without a deadline."""
+        return None if self.expires_at is None else max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def share(self, fraction: float) -> "Deadline":
+        """Returns a deadline ``fraction`` of the way from now to this one, for a stage that must leave time for later ones."""
+        remaining = self.remaining()
+        return Deadline(None if remaining is None else remaining * fraction)
+
+    def timeout(self, default: float) -> float:
+        """Returns ``default`` capped at the time left (but at least ``MIN_TIMEOUT``)."""
+        remaining = self.remaining()
+        return default if remaining is None else max(MIN_TIMEOUT, min(default, remaining))
+
+    def check(self, stage: str) -> None:
+        """Raises ``DeadlineExceeded`` if the budget is already spent before ``stage``."""
+        if self.expired():
+            REGISTRY.increment("deadline_exceeded_total", {"upstream": stage})
+            raise DeadlineExceeded(f"Time budget exhausted before {stage}")
+
+
+def _timed(kind: str, call: Callable[[], T]) -> T:
+    start = time.perf_counter()
+    result = call()
+    REGISTRY.observe("upstream_latency_seconds", time.perf_counter() - start, {"upstream": kind})
+    return result
+
+
+def hedge_threshold(kind: str) -> Optional[float]:
+    """Returns how long to wait before hedging a ``kind`` call, or ``None`` not to hedge."""
+    if not HEDGING_ENABLED:
+        return None
+    if REGISTRY.count("upstream_latency_seconds", {"upstream": kind}) < HEDGE_MIN_SAMPLES:
+        return None
+    return REGISTRY.percentile("upstream_latency_seconds", HEDGE_QUANTILE, {"upstream": kind})
+
+
+def _discard_losers(attempts: list[Future], winner: Optional[Future], discard: Optional[Callable[[Any], None]]) -> None:
+    """Cancels attempts that have not started and hands every other attempt's result, now or once it arrives, to ``discard``."""
+    def close(future: Future) -> None:
+        if future.cancelled() or future.exception() is not None:
+            return
+        try:
+            discard(future.result())
+        except Exception:
+            # Cleaning up an abandoned attempt must not fail the request that no longer needs it.
+            pass
+
+    for future in attempts:
+        if future is winner or future.cancel():
+            continue
+        if discard is not None:
+            future.add_done_callback(close)
+
+
+def hedged_call(
+    kind: str,
+    call: Callable[[], T],
+    deadline: Optional[Deadline] = None,
+    hedge_slot: Optional[Callable[[], bool]] = None,
+    discard: Optional[Callable[[T], None]] = None,
+) -> T:
+    """
+    Runs an idempotent upstream call within ``deadline``, sending a duplicate if the first
+    attempt is slower than the usual ``HEDGE_QUANTILE`` latency of ``kind`` calls, and returns
+    the first successful result.
+
+    Args:
+        kind: The kind of call, which keys its latency series (e.g. ``"openweathermap"`` or
+            ``"gemini.location"``), so each is hedged against calls like it.
+        call: Makes the request; it is called once per attempt, each time in a copy of the
+            caller's context so spans and scheduler priority carry over.
+        deadline: The request's deadline (none by default).
+        hedge_slot: Claims the upstream's rate-limit slot for a duplicate without waiting (see
+            ``common.scheduler.try_acquire``); the duplicate is skipped if it returns ``False``.
+            Without it no duplicate is ever sent, e.g. for Nominatim, whose usage policy forbids them.
+        discard: Releases the result of an attempt that lost (e.g. closes a stream), whether it
+            finishes before or after the winner.
+
+    Raises:
+        DeadlineExceeded: If no attempt succeeds before the deadline.
+        Exception: The first error, if every attempt failed.
+    """
+    deadline = deadline or Deadline()
+    deadline.check(kind)
+    threshold = hedge_threshold(kind) if hedge_slot is not None else None
+    if threshold is None and not deadline.bounded:
+        return _timed(kind, call)
+
+    attempts = [_executor.submit(contextvars.copy_context().run, _timed, kind, call)]
+    if threshold is not None:
+        remaining = deadline.remaining()
+        done, _ = wait(attempts, timeout=threshold if remaining is None else min(threshold, remaining))
+        if not done and not deadline.expired():
+            if hedge_slot():
+                attempts.append(_executor.submit(contextvars.copy_context().run, _timed, kind, call))
+                REGISTRY.increment("hedged_requests_total", {"upstream": kind})
+                span = current_span()
+                if span is not None:
+                    span.set(hedged=True)
+            else:
+                REGISTRY.increment("hedges_skipped_total", {"upstream": kind})
+
+    errors = []
+    pending = set(attempts)
+    while pending:
+        done, pending = wait(pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                _discard_losers(attempts, future, discard)
+                return future.result()
+            errors.append(future.exception())
+    if not pending:
+        raise errors[0]
+    _discard_losers(attempts, None, discard)
+    REGISTRY.increment("deadline_exceeded_total", {"upstream": kind})
+    raise DeadlineExceeded(f"{kind} did not answer within the time budget")
+
+
+def close_stream(response: Any, items: Optional[Iterator] = None) -> None:
+    """
+    Stops a streamed response that will not be read any further, so the upstream stops
+    generating (and billing) it. Streams without a way to stop them are left to be collected.
+    """
+    # The Gemini SDK keeps the underlying gRPC stream in ``_iterator``; cancelling it ends the generation.
+    for stream in (items, getattr(response, "_iterator", None), response):
+        for method in ("cancel", "close"):
+            stop = getattr(stream, method, None)
+            if callable(stop):
+                stop()
+
+
+def hedged_stream(
+    kind: str,
+    start: Callable[[], Iterable[T]],
+    deadline: Optional[Deadline] = None,
+    hedge_slot: Optional[Callable[[], bool]] = None,
+) -> tuple[Any, Iterator[T]]:
+    """
+    Starts a streamed upstream call with ``hedged_call``, up to and including its first item, and
+    then continues the winning stream. The losing stream is closed with ``close_stream``.
+
+    Args:
+        kind: The kind of call, which keys its latency series; its latency is the time to first item.
+        start: Starts the stream and returns the response to iterate (e.g. a streamed Gemini response).
+        deadline: The request's deadline (none by default); it is checked again before every later item.
+        hedge_slot: Claims a rate-limit slot for a duplicate, as in ``hedged_call``.
+
+    Returns:
+        The winning response (e.g. for its usage metadata once consumed) and an iterator over all its
+        items. Closing the iterator early also closes the response.
+
+    Raises:
+        DeadlineExceeded: From the iterator, if the deadline passes while the stream is being read.
+    """
+    deadline = deadline or Deadline()
+
+    def first_item() -> tuple[Any, Iterator[T], list[T]]:
+        response = start()
+        items = iter(response)
+        return response, items, list(itertools.islice(items, 1))
+
+    response, items, head = hedged_call(
+        kind, first_item, deadline, hedge_slot=hedge_slot, discard=lambda attempt: close_stream(attempt[0], attempt[1]),
+    )
+
+    def stream() -> Iterator[T]:
+        finished = False
+        try:
+            yield from head
+            for item in items:
+                deadline.check(kind)
+                yield item
+            finished = True
+        finally:
+            if not finished:
+                close_stream(response, items)
+
+    return response, stream()
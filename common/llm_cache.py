@@ -0,0 +1,103 @@
+import hashlib
+import os
+import threading
+from typing import Any, Optional
+
+from common.cache import LRUCache, SQLiteCache, TieredCache, get_cache_path
+
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "disk")  # "memory" or "disk"
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 24 * 3600))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", 1024))
+LLM_CACHE_DISK_ENTRIES = int(os.getenv("LLM_CACHE_DISK_ENTRIES", 20000))
+LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+
+
+def prompt_key(model_name: str, prompt: str) -> str:
+    """Returns the content address of a generation: a SHA-256 of the model name and the exact prompt."""
+    return hashlib.sha256(f"{model_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+def token_counts(response: Any) -> dict[str, int]:
+    """Extracts the prompt/output token counts from a Gemini response's usage metadata, if present."""
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+        "output_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+        "total_tokens": getattr(usage, "total_token_count", 0) or 0,
+    }
+
+
+class LLMCache:
+    """
+    Content-addressed cache of generated text.
+
+    Entries are ``{"model", "text", "prompt_tokens", "output_tokens", "total_tokens"}`` dictionaries
+    stored in any backend exposing ``get``/``set``/``clear`` (``LRUCache``, ``SQLiteCache`` or
+    ``TieredCache``); the backend enforces size eviction, the cache sets the TTL.
+
+    Args:
+        backend: The storage backend.
+        ttl: The time-to-live in seconds of a cached generation.
+        bypass: When true, ``get`` always misses and ``set`` is a no-op.
+    """
+
+    def __init__(self, backend: Any, ttl: Optional[float] = LLM_CACHE_TTL, bypass: bool = LLM_CACHE_BYPASS):
+        self.backend = backend
+        self.ttl = ttl
+        self.bypass = bypass
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "saved_output_tokens": 0}
+
+    def get(self, model_name: str, prompt: str) -> Optional[dict]:
+        if self.bypass:
+            return None
+        entry = self.backend.get(prompt_key(model_name, prompt))
+        with self._stats_lock:
+            if entry is None:
+                self._stats["misses"] += 1
+            else:
+                self._stats["hits"] += 1
+                self._stats["saved_output_tokens"] += entry.get("output_tokens", 0)
+        return entry
+
+    def set(self, model_name: str, prompt: str, text: str, tokens: Optional[dict] = None) -> None:
+        if self.bypass:
+            return
+        entry = {"model": model_name, "text": text, **(tokens or token_counts(None))}
+        self.backend.set(prompt_key(model_name, prompt), entry, ttl=self.ttl)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._stats_lock:
+            return dict(self._stats)
+
+
+def build_llm_cache_backend(kind: str = LLM_CACHE_BACKEND) -> Any:
+    """
+    Builds an LLM cache backend.
+
+    Args:
+        kind: ``"memory"`` for an in-process LRU, or ``"disk"`` for an LRU in front of a SQLite store.
+    """
+    memory = LRUCache(max_entries=LLM_CACHE_SIZE)
+    if kind == "memory":
+        return memory
+    if kind == "disk":
+        disk = SQLiteCache(get_cache_path("llm.sqlite3"), table="llm_responses", max_entries=LLM_CACHE_DISK_ENTRIES)
+        return TieredCache(memory, disk)
+    raise ValueError(f"Unknown LLM cache backend: '{kind}'")
+
+
+_llm_cache: Optional[LLMCache] = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMCache:
+    """Returns the process-wide LLM response cache configured from the ``LLM_CACHE_*`` variables."""
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMCache(build_llm_cache_backend())
+        return _llm_cache
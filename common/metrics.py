@@ -0,0 +1,154 @@
+import json
+import math
+import threading
+from collections import deque
+from typing import Optional
+
+# Upper bounds (seconds) of the exported latency histogram buckets.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Number of recent observations kept per histogram to compute percentiles.
+RESERVOIR_SIZE = 2048
+
+
+def _label_key(labels: Optional[dict]) -> tuple:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _format_labels(label_key: tuple, extra: Optional[dict] = None) -> str:
+    labels = dict(label_key)
+    labels.update(extra or {})
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}"
+
+
+def quantile(values: list[float], q: float) -> float:
+    """Returns the nearest-rank ``q`` quantile (0-1) of ``values`` (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1))]
+
+
+class Histogram:
+    """Cumulative bucket counts for export plus a reservoir of recent values for percentiles."""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+
+    def percentile(self, q: float) -> float:
+        return quantile(list(self.recent), q)
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": round(self.percentile(0.50), 6),
+            "p95": round(self.percentile(0.95), 6),
+            "p99": round(self.percentile(0.99), 6),
+        }
+
+
+class MetricsRegistry:
+    """
+    A process-wide, thread-safe registry of counters, gauges and histograms with labels,
+    exportable as JSON or in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._gauges: dict[str, dict[tuple, float]] = {}
+        self._histograms: dict[str, dict[tuple, Histogram]] = {}
+        self._help: dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def increment(self, name: str, labels: Optional[dict] = None, amount: float = 1) -> None:
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + amount
+
+    def set_gauge(self, name: str, value: float, labels: Optional[dict] = None) -> None:
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, labels: Optional[dict] = None) -> None:
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            key = _label_key(labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def count(self, name: str, labels: Optional[dict] = None) -> int:
+        """Returns the number of observations of a histogram (0 if it has none)."""
+        with self._lock:
+            histogram = self._histograms.get(name, {}).get(_label_key(labels))
+            return 0 if histogram is None else histogram.count
+
+    def percentile(self, name: str, q: float, labels: Optional[dict] = None) -> Optional[float]:
+        """Returns the ``q`` quantile of a histogram, or ``None`` if it has no observations yet."""
+        with self._lock:
+            histogram = self._histograms.get(name, {}).get(_label_key(labels))
+            if histogram is None or not histogram.count:
+                return None
+            return histogram.percentile(q)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "counters": {name: [{"labels": dict(key), "value": value} for key, value in series.items()] for name, series in self._counters.items()},
+                "gauges": {name: [{"labels": dict(key), "value": value} for key, value in series.items()] for name, series in self._gauges.items()},
+                "histograms": {name: [{"labels": dict(key), **histogram.summary()} for key, histogram in series.items()] for name, series in self._histograms.items()},
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for kind, metrics in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in metrics.items():
+                    if name in self._help:
+                        lines.append(f"# HELP {name} {self._help[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in series.items():
+                        lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in self._histograms.items():
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                        lines.append(f"{name}_bucket{_format_labels(key, {'le': bound})} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, {'le': '+Inf'})} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+REGISTRY = MetricsRegistry()
+REGISTRY.describe("stage_latency_seconds", "Latency of pipeline stages, agents and upstream calls.")
+REGISTRY.describe("cache_requests_total", "Cache lookups by stage and result (hit/miss).")
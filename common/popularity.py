@@ -0,0 +1,137 @@
+import atexit
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from common.cache import get_cache_path
+
+# A destination's popularity halves every week without new requests.
+POPULARITY_HALF_LIFE = float(os.getenv("POPULARITY_HALF_LIFE", 7 * 24 * 3600))
+# Recorded requests are buffered in memory and written in one transaction per flush.
+POPULARITY_FLUSH_INTERVAL = float(os.getenv("POPULARITY_FLUSH_INTERVAL", 30))
+POPULARITY_FLUSH_SIZE = 100
+# Scores are weighted relative to this time (2025-01-01 UTC) instead of decayed in place.
+_EPOCH = 1735689600
+
+
+def _place_key(place: str) -> str:
+    return " ".join(place.split()).casefold()
+
+
+def _log2_add(a: float, b: float) -> float:
+    """Returns ``log2(2 ** a + 2 ** b)`` without computing either power, which would overflow."""
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def _log2_sum(values: list[float]) -> float:
+    high = max(values)
+    return high + math.log2(sum(2 ** (value - high) for value in values))
+
+
+class PopularityTracker:
+    """
+    Exponentially decayed request counts per ``(destination, days)``, shared between processes
+    through a SQLite table.
+
+    Rather than decaying every stored score, each request adds a weight of
+    ``2 ** ((now - epoch) / half_life)``, which ranks destinations exactly like a decayed count
+    and keeps every write a single upsert. The weights grow without bound, so scores are stored
+    as their base-2 logarithm (``log_score``) and added with ``log2(2 ** a + 2 ** b)``.
+
+    Args:
+        path: The SQLite database file, or ``None`` to keep the counts in memory only.
+        half_life: Seconds after which a request counts half as much.
+
+    Raises:
+        ValueError: If ``half_life`` is not positive.
+    """
+
+    def __init__(self, path: Optional[str] = None, half_life: float = POPULARITY_HALF_LIFE):
+        if not half_life > 0:
+            raise ValueError(f"The popularity half-life must be a positive number of seconds, not {half_life!r}")
+        self.half_life = half_life
+        self._lock = threading.Lock()
+        self._pending: dict[tuple[str, int], tuple[str, float]] = {}
+        self._last_flush = time.monotonic()
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._conn.create_function("log2_add", 2, _log2_add, deterministic=True)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS popularity "
+                "(place_key TEXT NOT NULL, days INTEGER NOT NULL, place TEXT NOT NULL, log_score REAL NOT NULL, "
+                "PRIMARY KEY (place_key, days))"
+            )
+
+    def _log_weight(self, now: float) -> float:
+        return (now - _EPOCH) / self.half_life
+
+    def record(self, place: str, days: int) -> None:
+        """Counts one served request for ``place`` over ``days`` days."""
+        if not place:
+            return
+        log_weight = self._log_weight(time.time())
+        with self._lock:
+            key = (_place_key(place), int(days))
+            pending = self._pending.get(key)
+            self._pending[key] = (place, log_weight if pending is None else _log2_add(pending[1], log_weight))
+            due = len(self._pending) >= POPULARITY_FLUSH_SIZE or time.monotonic() - self._last_flush >= POPULARITY_FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes the buffered counts to the database."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+            if not pending:
+                return
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO popularity (place_key, days, place, log_score) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (place_key, days) DO UPDATE SET log_score = log2_add(log_score, excluded.log_score), place = excluded.place",
+                    [(place_key, days, place, log_score) for (place_key, days), (place, log_score) in pending.items()],
+                )
+
+    def top(self, limit: int, days_per_place: int = 2) -> list[tuple[str, list[int]]]:
+        """
+        Returns up to ``limit`` of the most requested destinations, most popular first, each with
+        its ``days_per_place`` most requested ``days`` values.
+        """
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute("SELECT place_key, place, days, log_score FROM popularity").fetchall()
+        places: dict[str, dict] = {}
+        for place_key, place, days, log_score in rows:
+            entry = places.setdefault(place_key, {"place": place, "days": []})
+            entry["days"].append((log_score, days))
+        for entry in places.values():
+            entry["log_score"] = _log2_sum([log_score for log_score, _ in entry["days"]])
+        ranked = sorted(places.values(), key=lambda entry: entry["log_score"], reverse=True)[:limit]
+        return [(entry["place"], [days for _, days in sorted(entry["days"], reverse=True)[:days_per_place]]) for entry in ranked]
+
+    def prune(self, keep: int = 10000) -> None:
+        """Deletes all but the ``keep`` highest-scoring rows."""
+        self.flush()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM popularity WHERE rowid NOT IN (SELECT rowid FROM popularity ORDER BY log_score DESC LIMIT ?)",
+                (keep,),
+            )
+
+
+_popularity_tracker: Optional[PopularityTracker] = None
+_popularity_tracker_lock = threading.Lock()
+
+
+def get_popularity_tracker() -> PopularityTracker:
+    """Returns the process-wide tracker, backed by ``popularity.sqlite3`` in the cache directory."""
+    global _popularity_tracker
+    with _popularity_tracker_lock:
+        if _popularity_tracker is None:
+            _popularity_tracker = PopularityTracker(get_cache_path("popularity.sqlite3"))
+            atexit.register(_popularity_tracker.flush)
+        return _popularity_tracker
@@ -0,0 +1,342 @@
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from common.deadline import Deadline, DeadlineExceeded
+from common.metrics import REGISTRY
+
+NOMINATIM = "nominatim"
+OPENWEATHERMAP = "openweathermap"
+GEMINI = "gemini"
+
+# Lower values are served first.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_PREFETCH = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BATCH: "batch", PRIORITY_PREFETCH: "prefetch"}
+
+# Nominatim's usage policy allows at most one request per second.
+NOMINATIM_RATE_PER_SECOND = float(os.getenv("NOMINATIM_RATE_PER_SECOND", 1))
+OPENWEATHERMAP_RATE_PER_MINUTE = float(os.getenv("OPENWEATHERMAP_RATE_PER_MINUTE", 60))
+GEMINI_RATE_PER_MINUTE = float(os.getenv("GEMINI_RATE_PER_MINUTE", 15))
+GEMINI_TOKENS_PER_MINUTE = float(os.getenv("GEMINI_TOKENS_PER_MINUTE", 250_000))
+# Requests allowed to wait per upstream, and the longest a request may wait, before load is shed.
+SCHEDULER_MAX_QUEUE = int(os.getenv("SCHEDULER_MAX_QUEUE", 100))
+SCHEDULER_MAX_WAIT = float(os.getenv("SCHEDULER_MAX_WAIT", 30))
+# Pause after a 429 response without a usable Retry-After header.
+RATE_LIMIT_BACKOFF = float(os.getenv("RATE_LIMIT_BACKOFF", 10))
+
+REGISTRY.describe("scheduler_queue_depth", "Requests waiting for an upstream rate-limit slot.")
+REGISTRY.describe("scheduler_wait_seconds", "Time requests waited for an upstream rate-limit slot.")
+REGISTRY.describe("scheduler_shed_total", "Requests rejected by the scheduler instead of queued, by upstream and reason.")
+REGISTRY.describe("upstream_rate_limited_total", "429 (rate limited) responses received from upstreams.")
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("request_priority", default=PRIORITY_INTERACTIVE)
+_scheduler: Optional["Scheduler"] = None
+_scheduler_lock = threading.Lock()
+
+
+class UpstreamOverloaded(Exception):
+    """Raised when the scheduler sheds a request instead of letting it wait for an upstream."""
+
+    def __init__(self, upstream: str, reason: str, priority: int):
+        self.upstream = upstream
+        self.reason = reason
+        self.priority = priority
+        super().__init__(f"{upstream} is overloaded ({reason}); {PRIORITY_NAMES.get(priority, priority)} request shed. Please try again shortly.")
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+@contextmanager
+def request_priority(priority: int) -> Iterator[None]:
+    """Runs the block's upstream calls at ``priority`` (e.g. ``PRIORITY_BATCH``)."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def estimate_tokens(prompt: str) -> int:
+    """Estimates a prompt's token count (about four characters per token) for the token budget."""
+    return len(prompt) // 4 + 1
+
+
+class TokenBucket:
+    """
+    Refills ``rate`` tokens per second up to ``capacity``. Not thread-safe: ``UpstreamLimiter``
+    only uses it under its lock.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Returns the seconds until ``amount`` tokens (at most a full bucket) are available."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def backlog(self, count: float, now: float) -> float:
+        """Returns the seconds until ``count`` requests of one token each will all have been served."""
+        self._refill(now)
+        return max(0.0, count - self.tokens) / self.rate
+
+    def take(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+    def pause(self, seconds: float, now: float) -> None:
+        """Empties the bucket so nothing is available for ``seconds``."""
+        self._refill(now)
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class UpstreamLimiter:
+    """
+    Grants requests to one upstream in priority order (FIFO within a priority) at the rate its
+    buckets allow.
+
+    Requests are shed with ``UpstreamOverloaded`` rather than queued when the queue is full or
+    their estimated wait exceeds ``max_wait``, and when they have waited ``max_wait`` seconds.
+    A request with a deadline that ends sooner waits at most until then and raises
+    ``DeadlineExceeded`` instead, so callers can fall back rather than fail.
+
+    Args:
+        name: The upstream name used in metrics and errors.
+        rate: Requests per second.
+        burst: Requests that may be made back to back after an idle period.
+        token_rate: Optional tokens per second (e.g. an LLM token-per-minute limit / 60).
+        token_burst: Tokens that may be spent back to back (defaults to one minute's worth).
+        max_queue: Requests allowed to wait.
+        max_wait: The longest a request may wait, in seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: float = 1,
+        token_rate: Optional[float] = None,
+        token_burst: Optional[float] = None,
+        max_queue: int = SCHEDULER_MAX_QUEUE,
+        max_wait: float = SCHEDULER_MAX_WAIT,
+    ):
+        self.name = name
+        self.requests = TokenBucket(rate, burst)
+        self.tokens = TokenBucket(token_rate, token_burst or token_rate * 60) if token_rate else None
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._queue: list[tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def _delay(self, tokens: float, now: float) -> float:
+        delay = self.requests.delay(1, now)
+        if self.tokens is not None and tokens:
+            delay = max(delay, self.tokens.delay(tokens, now))
+        return delay
+
+    def _shed(self, reason: str, detail: str, priority: int) -> UpstreamOverloaded:
+        REGISTRY.increment("scheduler_shed_total", {"upstream": self.name, "reason": reason})
+        return UpstreamOverloaded(self.name, detail, priority)
+
+    def _give_up(self, reason: str, detail: str, priority: int, by_deadline: bool) -> Exception:
+        if by_deadline:
+            REGISTRY.increment("deadline_exceeded_total", {"upstream": f"{self.name}.queue"})
+            return DeadlineExceeded(f"{self.name} has no slot within the time budget ({detail})")
+        return self._shed(reason, detail, priority)
+
+    def _report_depth(self) -> None:
+        REGISTRY.set_gauge("scheduler_queue_depth", len(self._queue), {"upstream": self.name})
+
+    def acquire(self, tokens: float = 0, priority: Optional[int] = None, deadline: Optional[Deadline] = None) -> float:
+        """
+        Blocks until the upstream may be called and returns the seconds waited.
+
+        Args:
+            tokens: Tokens the request will spend from the token budget, if the upstream has one.
+            priority: The request priority (defaults to the one set with ``request_priority``).
+            deadline: The request's deadline; the wait is capped at its remaining time.
+
+        Raises:
+            UpstreamOverloaded: If the request is shed.
+            DeadlineExceeded: If no slot is free before the deadline.
+        """
+        priority = current_priority() if priority is None else priority
+        start = time.monotonic()
+        remaining = deadline.remaining() if deadline is not None else None
+        by_deadline = remaining is not None and remaining < self.max_wait
+        max_wait = remaining if by_deadline else self.max_wait
+        with self._condition:
+            if len(self._queue) >= self.max_queue:
+                raise self._shed("queue_full", f"{len(self._queue)} requests already waiting", priority)
+            ahead = sum(1 for entry in self._queue if entry[0] <= priority)
+            estimate = max(self.requests.backlog(ahead + 1, start), self._delay(tokens, start))
+            if estimate > max_wait:
+                raise self._give_up("wait_too_long", f"estimated wait {estimate:.1f}s exceeds {max_wait:.1f}s", priority, by_deadline)
+
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._queue, entry)
+            self._report_depth()
+            give_up_at = start + max_wait
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._queue[0] is entry:
+                        delay = self._delay(tokens, now)
+                        if delay <= 0:
+                            heapq.heappop(self._queue)
+                            self.requests.take(1, now)
+                            if self.tokens is not None and tokens:
+                                self.tokens.take(tokens, now)
+                            break
+                        if now + delay > give_up_at:
+                            raise self._give_up("wait_too_long", f"next slot in {delay:.1f}s, after waiting {now - start:.1f}s", priority, by_deadline)
+                        timeout = delay
+                    else:
+                        timeout = give_up_at - now
+                        if timeout <= 0:
+                            raise self._give_up("timeout", f"waited {now - start:.1f}s in queue", priority, by_deadline)
+                    self._condition.wait(timeout)
+            except BaseException:
+                if entry in self._queue:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                raise
+            finally:
+                self._report_depth()
+                # Wake the waiters so the new head of the queue can claim its slot.
+                self._condition.notify_all()
+
+        waited = time.monotonic() - start
+        REGISTRY.observe("scheduler_wait_seconds", waited, {"upstream": self.name, "priority": PRIORITY_NAMES.get(priority, str(priority))})
+        return waited
+
+    def try_acquire(self, tokens: float = 0) -> bool:
+        """
+        Claims a slot only if one is free right now and no request is waiting for it, e.g. for a
+        hedged duplicate that is only worth sending when it costs nobody a wait. Returns whether it did.
+        """
+        with self._condition:
+            now = time.monotonic()
+            if self._queue or self._delay(tokens, now) > 0:
+                return False
+            self.requests.take(1, now)
+            if self.tokens is not None and tokens:
+                self.tokens.take(tokens, now)
+            return True
+
+    def backoff(self, seconds: float) -> None:
+        """Holds every request to this upstream for ``seconds``, e.g. after a 429 response."""
+        with self._condition:
+            self.requests.pause(seconds, time.monotonic())
+            self._condition.notify_all()
+
+
+class Scheduler:
+    """Routes upstream calls through per-upstream limiters; upstreams without one are not limited."""
+
+    def __init__(self, limiters: Optional[dict[str, UpstreamLimiter]] = None):
+        self.limiters = limiters or {}
+
+    def acquire(self, upstream: str, tokens: float = 0, deadline: Optional[Deadline] = None) -> float:
+        limiter = self.limiters.get(upstream)
+        return limiter.acquire(tokens, deadline=deadline) if limiter is not None else 0.0
+
+    def try_acquire(self, upstream: str, tokens: float = 0) -> bool:
+        limiter = self.limiters.get(upstream)
+        return limiter.try_acquire(tokens) if limiter is not None else True
+
+    def backoff(self, upstream: str, seconds: float = RATE_LIMIT_BACKOFF) -> None:
+        REGISTRY.increment("upstream_rate_limited_total", {"upstream": upstream})
+        limiter = self.limiters.get(upstream)
+        if limiter is not None:
+            limiter.backoff(seconds)
+
+
+def build_scheduler() -> Scheduler:
+    """Builds a scheduler with the configured Nominatim, OpenWeatherMap and Gemini limits."""
+    return Scheduler({
+        NOMINATIM: UpstreamLimiter(NOMINATIM, NOMINATIM_RATE_PER_SECOND),
+        OPENWEATHERMAP: UpstreamLimiter(OPENWEATHERMAP, OPENWEATHERMAP_RATE_PER_MINUTE / 60, burst=max(1, OPENWEATHERMAP_RATE_PER_MINUTE / 6)),
+        GEMINI: UpstreamLimiter(
+            GEMINI,
+            GEMINI_RATE_PER_MINUTE / 60,
+            burst=max(1, GEMINI_RATE_PER_MINUTE / 6),
+            token_rate=GEMINI_TOKENS_PER_MINUTE / 60,
+        ),
+    })
+
+
+def get_scheduler() -> Scheduler:
+    """Returns the process-wide scheduler shared by all agents."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = build_scheduler()
+        return _scheduler
+
+
+def install_scheduler(scheduler: Optional[Scheduler]) -> None:
+    """Replaces the shared scheduler (``None`` restores the configured one on next use)."""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
+
+
+def try_acquire(upstream: str, tokens: float = 0) -> bool:
+    """Claims a slot for ``upstream`` if one is free right now (see ``UpstreamLimiter.try_acquire``)."""
+    return get_scheduler().try_acquire(upstream, tokens)
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Whether an exception from ``requests`` or the Gemini SDK is a 429 (rate limited) response."""
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    return getattr(error, "code", None) == 429 or type(error).__name__ == "ResourceExhausted"
+
+
+def _retry_after(error: BaseException) -> float:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After", RATE_LIMIT_BACKOFF))
+    except (TypeError, ValueError):
+        return RATE_LIMIT_BACKOFF
+
+
+@contextmanager
+def upstream_call(upstream: str, tokens: float = 0, deadline: Optional[Deadline] = None) -> Iterator[float]:
+    """
+    Waits for the upstream's rate limits at the current priority, but not past ``deadline``, then
+    runs the block. Yields the seconds waited. A 429 raised in the block pauses the upstream
+    before propagating.
+
+    Raises:
+        UpstreamOverloaded: If the request is shed instead of waiting.
+        DeadlineExceeded: If no slot is free before the deadline.
+    """
+    scheduler = get_scheduler()
+    waited = scheduler.acquire(upstream, tokens, deadline)
+    try:
+        yield waited
+    except Exception as e:
+        if is_rate_limit_error(e):
+            scheduler.backoff(upstream, _retry_after(e))
+        raise
@@ -0,0 +1,113 @@
+import contextvars
+import itertools
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from common.metrics import REGISTRY
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class Span:
+    """
+    A timed unit of work (pipeline -> agent -> upstream call) with monotonic start/end times,
+    a parent span and free-form attributes such as prompt/response sizes and cache hits.
+    """
+
+    def __init__(self, name: str, parent: Optional["Span"]):
+        self.name = name
+        self.span_id = next(_span_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.attributes: dict = {}
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def trace_span(name: str, logs: Optional[list[dict]] = None, step: Optional[str] = None, status: str = "in_progress", details: str = "") -> Iterator[Span]:
+    """
+    Times a block as a child of the current span and records it in the metrics registry.
+
+    When ``logs`` is given, a regular ``{"step", "status", "details"}`` entry is appended when the
+    block starts and gets a ``"span"`` key with its timings and attributes when the block ends,
+    so the agents' log lists double as traces.
+
+    Args:
+        name: The stage name used for the span and the ``stage`` metrics label.
+        logs: Optional agent log list to record the span in.
+        step: The log entry's step text (defaults to ``name``).
+        status: The log entry's status.
+        details: The log entry's details.
+    """
+    span = Span(name, _current_span.get())
+    entry = None
+    if logs is not None:
+        entry = {"step": step or name, "status": status, "details": details}
+        logs.append(entry)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        if not isinstance(e, GeneratorExit):
+            span.set(error=type(e).__name__)
+        raise
+    finally:
+        span.end = time.perf_counter()
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # A generator closed from another context; its context is discarded anyway.
+            pass
+        if entry is not None:
+            entry["span"] = span.to_dict()
+        REGISTRY.observe("stage_latency_seconds", span.duration, {"stage": name})
+        if "cache_hit" in span.attributes:
+            REGISTRY.increment("cache_requests_total", {"stage": name, "result": "hit" if span.attributes["cache_hit"] else "miss"})
+
+
+def render_waterfall(logs: list[dict], width: int = 40) -> str:
+    """
+    Renders the spans recorded in a log list as a text waterfall, one line per span, indented by
+    nesting depth and offset from the earliest span. Returns an empty string if there are none.
+    """
+    spans = [entry["span"] for entry in logs if "span" in entry]
+    if not spans:
+        return ""
+    origin = min(span["start"] for span in spans)
+    total = max((span["end"] or span["start"]) - origin for span in spans) or 1e-9
+    depth = {}
+    for span in sorted(spans, key=lambda span: span["start"]):
+        depth[span["span_id"]] = depth.get(span["parent_id"], -1) + 1
+    lines = []
+    for span in sorted(spans, key=lambda span: span["start"]):
+        offset = span["start"] - origin
+        first = min(width - 1, int(offset / total * width))
+        length = min(width - first, max(1, int(span["duration_ms"] / 1000 / total * width)))
+        label = ("  " * depth[span["span_id"]] + span["name"])[:28]
+        flags = " (cache hit)" if span["attributes"].get("cache_hit") else ""
+        lines.append(f"{label:<28} |{' ' * first}{'█' * length:<{width - first}}| {offset * 1000:8.1f}ms +{span['duration_ms']:.1f}ms{flags}")
+    return "\n".join(lines)
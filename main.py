@@ -1,12 +1,17 @@
+import argparse
+import asyncio
 import os
 import warnings
 from dotenv import load_dotenv
 from agent1.weather_agent import get_weather
-from agent2.precaution_agent import get_precautions
-from agent3.itinerary_agent import get_itinerary
+from batch import print_summary, run_batch
+from common.deadline import PIPELINE_DEADLINE, WEATHER_DEADLINE_SHARE, Deadline
+from common.popularity import get_popularity_tracker
+from orchestrator import PRECAUTION_AGENT, format_weather_report, stream_followup_agents
+from prefetch import PREFETCH_DAYS_PER_PLACE, PREFETCH_TOP_N, PREFETCH_WORKERS, run_prefetch_cycle, run_prefetcher, start_prefetcher
+from service import SERVICE_MAX_CONCURRENCY, SERVICE_MAX_PENDING, PlanService
 
-def main():
-    warnings.filterwarnings("ignore", category=FutureWarning)
+def load_api_keys():
     load_dotenv() # Load environment variables from .env file
 
     weather_api_key = os.getenv("WEATHER_API_KEY")
@@ -14,37 +19,110 @@ def main():
 
     if not weather_api_key:
         print("Error: WEATHER_API_KEY not found in .env file or environment variables.")
-        return
+        return None, None
     if not gemini_api_key:
         print("Error: GEMINI_API_KEY not found in .env file or environment variables.")
-        return
-        
+        return None, None
+    return weather_api_key, gemini_api_key
+
+def interactive(weather_api_key, gemini_api_key):
     query = input("Enter your query (e.g., 'I am planning a trip to Kochi'): ")
     days = int(input("Enter the number of days for the forecast and itinerary: "))
 
-    weather_report, extracted_place_name, weather_logs = get_weather(query, days, weather_api_key, gemini_api_key)
+    deadline = Deadline(PIPELINE_DEADLINE)
+    structured_weather_data, extracted_place_name, weather_logs = get_weather(query, days, weather_api_key, gemini_api_key, deadline.share(WEATHER_DEADLINE_SHARE))
     
-    if not extracted_place_name:
+    if not extracted_place_name or not structured_weather_data:
         print("Weather Report:")
-        print(weather_report)
+        print("Could not extract a location or fetch weather data for this query.")
         return
 
+    get_popularity_tracker().record(extracted_place_name, days)
+    weather_report = format_weather_report(structured_weather_data, extracted_place_name, days)
+
     print(f"\nGetting weather for {extracted_place_name} for {days} days...")
     print("Weather Report:")
     print(weather_report)
 
-    if "this place is in-serviceable" in weather_report:
+    # Both agents stream concurrently; precautions are printed live while the itinerary is
+    # buffered until they finish, then printed (and streamed) after them.
+    print("\nAnalyzing weather, suggesting precautions and generating travel itinerary...")
+    print("Precautions:")
+    precautions_done = False
+    itinerary_buffer = ""
+    for agent, event, payload in stream_followup_agents(weather_report, extracted_place_name, days, gemini_api_key, structured_weather_data=structured_weather_data, deadline=deadline):
+        if agent == PRECAUTION_AGENT:
+            if event == "chunk":
+                print(payload, end="", flush=True)
+            else:
+                precautions_done = True
+                print("\n\nTravel Itinerary:")
+                print(itinerary_buffer, end="", flush=True)
+        elif event == "chunk":
+            if precautions_done:
+                print(payload, end="", flush=True)
+            else:
+                itinerary_buffer += payload
+    print()
+
+def run_batch_command(args, weather_api_key, gemini_api_key):
+    stats = run_batch(args.input, args.output, weather_api_key, gemini_api_key, workers=args.workers, resume=not args.no_resume)
+    print_summary(stats)
+
+def run_serve_command(args, weather_api_key, gemini_api_key):
+    if args.prefetch:
+        start_prefetcher(weather_api_key, gemini_api_key)
+    service = PlanService(weather_api_key, gemini_api_key, max_concurrency=args.max_concurrency, max_pending=args.max_pending)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+def run_prefetch_command(args, weather_api_key, gemini_api_key):
+    options = {"top_n": args.top, "days_per_place": args.days_per_place, "workers": args.workers}
+    if args.once:
+        stats = run_prefetch_cycle(weather_api_key, gemini_api_key, **options)
+        print(f"Prefetch: {stats['planned']} planned, {stats['failed']} failed, {stats['skipped']} skipped over budget; upstream calls {stats['calls']}")
         return
+    try:
+        run_prefetcher(weather_api_key, gemini_api_key, **options)
+    except KeyboardInterrupt:
+        pass
 
-    print("\nAnalyzing weather and suggesting precautions...")
-    precautions, precautions_logs = get_precautions(weather_report, extracted_place_name, gemini_api_key)
-    print("Precautions:")
-    print(precautions)
+def main():
+    parser = argparse.ArgumentParser(description="Multi-Agent Weather & Travel Assistant")
+    subparsers = parser.add_subparsers(dest="command")
+    batch_parser = subparsers.add_parser("batch", help="Plan every {query, days} record of a JSONL file")
+    batch_parser.add_argument("input", help="JSONL file of {\"query\": ..., \"days\": ...} records")
+    batch_parser.add_argument("-o", "--output", required=True, help="JSONL file results and logs are appended to")
+    batch_parser.add_argument("-w", "--workers", type=int, default=4, help="Number of records planned concurrently (default: 4)")
+    batch_parser.add_argument("--no-resume", action="store_true", help="Overwrite the output instead of skipping completed records")
+    serve_parser = subparsers.add_parser("serve", help="Serve a JSON API (POST /plan) with coalescing of identical requests")
+    serve_parser.add_argument("--host", default="0.0.0.0", help="Interface to listen on (default: 0.0.0.0)")
+    serve_parser.add_argument("-p", "--port", type=int, default=8080, help="Port to listen on (default: 8080)")
+    serve_parser.add_argument("--max-concurrency", type=int, default=SERVICE_MAX_CONCURRENCY, help="Pipelines computed at the same time (default: SERVICE_MAX_CONCURRENCY or 8)")
+    serve_parser.add_argument("--max-pending", type=int, default=SERVICE_MAX_PENDING, help="Distinct plans allowed to wait before returning 503 (default: SERVICE_MAX_PENDING or 64)")
+    serve_parser.add_argument("--prefetch", action="store_true", help="Also run the cache prefetcher in this process")
+    prefetch_parser = subparsers.add_parser("prefetch", help="Keep popular destinations cached, refreshing after every forecast update")
+    prefetch_parser.add_argument("--once", action="store_true", help="Run a single cycle and exit")
+    prefetch_parser.add_argument("--top", type=int, default=PREFETCH_TOP_N, help=f"Destinations to warm (default: {PREFETCH_TOP_N})")
+    prefetch_parser.add_argument("--days-per-place", type=int, default=PREFETCH_DAYS_PER_PLACE, help=f"Most requested day counts warmed per destination (default: {PREFETCH_DAYS_PER_PLACE})")
+    prefetch_parser.add_argument("-w", "--workers", type=int, default=PREFETCH_WORKERS, help=f"Destinations planned concurrently (default: {PREFETCH_WORKERS})")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore", category=FutureWarning)
+    weather_api_key, gemini_api_key = load_api_keys()
+    if not weather_api_key or not gemini_api_key:
+        return
 
-    print("\nGenerating travel itinerary...")
-    itinerary, itinerary_logs = get_itinerary(weather_report, extracted_place_name, days, gemini_api_key)
-    print("Travel Itinerary:")
-    print(itinerary)
+    if args.command == "batch":
+        run_batch_command(args, weather_api_key, gemini_api_key)
+    elif args.command == "serve":
+        run_serve_command(args, weather_api_key, gemini_api_key)
+    elif args.command == "prefetch":
+        run_prefetch_command(args, weather_api_key, gemini_api_key)
+    else:
+        interactive(weather_api_key, gemini_api_key)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
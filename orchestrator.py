@@ -0,0 +1,214 @@
+import contextvars
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterator, Optional
+
+from agent1.weather_agent import get_weather
+from agent2.precaution_agent import get_precautions, stream_precautions
+from agent3.itinerary_agent import ITINERARY_MODE, get_itinerary, get_itinerary_by_day, stream_itinerary, stream_itinerary_by_day
+from common.deadline import PIPELINE_DEADLINE, WEATHER_DEADLINE_SHARE, Deadline
+from common.popularity import get_popularity_tracker
+from common.tracing import trace_span
+
+PRECAUTION_AGENT = "precautions"
+ITINERARY_AGENT = "itinerary"
+
+
+def format_weather_report(structured_weather_data: list[dict], place: str, days: int) -> str:
+    """
+    Formats the structured daily forecast into the weather report string used in the LLM prompts.
+
+    Args:
+        structured_weather_data: The daily forecast dictionaries returned by the Weather Agent.
+        place: The name of the place.
+        days: The number of days for the forecast.
+
+    Returns:
+        The formatted weather report (str), or an empty string if there is no forecast data.
+    """
+    if not structured_weather_data:
+        return ""
+    weather_report = f"Weather forecast for {place} for the next {days} day(s):\n"
+    for day_data in structured_weather_data:
+        weather_report += (
+            f"  {day_data['Date']}: {day_data['Weather']}, "
+            f"High: {day_data['High Temp (°C)']}°C, "
+            f"Low: {day_data['Low Temp (°C)']}°C\n"
+        )
+    return weather_report
+
+
+def run_followup_agents(
+    weather_report: str,
+    place: str,
+    days: int,
+    api_key: str,
+    on_complete: Optional[Callable[[str, str, list[dict]], None]] = None,
+    structured_weather_data: Optional[list[dict]] = None,
+    deadline: Optional[Deadline] = None,
+) -> dict[str, tuple[str, list[dict]]]:
+    """
+    Runs the Precaution Agent and the Itinerary Agent concurrently on the same weather report.
+
+    Both agents only depend on the Weather Agent's output, so they are fanned out on a
+    thread pool and the end-to-end latency is that of the slower of the two Gemini calls.
+
+    Args:
+        weather_report: The formatted weather report string.
+        place: The name of the place.
+        days: The number of days for the itinerary.
+        api_key: The Gemini API key.
+        on_complete: Optional callback invoked as ``on_complete(agent, text, logs)`` as soon as
+            each agent finishes. It runs on the calling thread, so it is safe to update UI
+            elements (e.g. Streamlit status panels) from it.
+        structured_weather_data: The Weather Agent's daily forecast. When given and ``ITINERARY_MODE``
+            is ``"per_day"``, the itinerary is assembled from cached and regenerated day plans. It
+            is also what rule-based precautions are built from if Gemini cannot answer in time.
+        deadline: The time budget both agents share (none by default).
+
+    Returns:
+        A dictionary mapping each agent name (``PRECAUTION_AGENT``, ``ITINERARY_AGENT``) to a
+        tuple of its generated text and its log entries.
+    """
+    results = {}
+    if ITINERARY_MODE == "per_day" and structured_weather_data:
+        itinerary_call = (get_itinerary_by_day, structured_weather_data, place, days, api_key)
+    else:
+        itinerary_call = (get_itinerary, weather_report, place, days, api_key)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        # Each agent runs in a copy of the caller's context so its trace spans nest under the caller's.
+        futures = {
+            executor.submit(
+                contextvars.copy_context().run, get_precautions, weather_report, place, api_key,
+                deadline=deadline, structured_weather_data=structured_weather_data,
+            ): PRECAUTION_AGENT,
+            executor.submit(contextvars.copy_context().run, *itinerary_call, deadline=deadline): ITINERARY_AGENT,
+        }
+        for future in as_completed(futures):
+            agent = futures[future]
+            # Both agents turn their own failures into error strings and log entries.
+            text, logs = future.result()
+            results[agent] = (text, logs)
+            if on_complete:
+                on_complete(agent, text, logs)
+    return results
+
+
+def stream_followup_agents(
+    weather_report: str,
+    place: str,
+    days: int,
+    api_key: str,
+    structured_weather_data: Optional[list[dict]] = None,
+    deadline: Optional[Deadline] = None,
+) -> Iterator[tuple[str, str, object]]:
+    """
+    Runs the Precaution Agent and the Itinerary Agent concurrently and streams their output.
+
+    Each agent's generator runs on its own worker thread; chunks are handed back through a queue
+    so the caller can render both outputs incrementally from its own thread.
+
+    Args:
+        weather_report: The formatted weather report string.
+        place: The name of the place.
+        days: The number of days for the itinerary.
+        api_key: The Gemini API key.
+        structured_weather_data: The Weather Agent's daily forecast, used for the per-day itinerary
+            mode and the precautions fallback as in ``run_followup_agents``.
+        deadline: The time budget both agents share (none by default).
+
+    Yields:
+        ``(agent, "chunk", text)`` for every generated chunk, and ``(agent, "done", (text, logs))``
+        once an agent has finished. The final text and logs are the same as ``run_followup_agents``.
+    """
+    events = queue.Queue()
+
+    def run(agent: str, chunks: Iterator[str], logs: list[dict]) -> None:
+        text = ""
+        try:
+            for chunk in chunks:
+                text += chunk
+                events.put((agent, "chunk", chunk))
+        finally:
+            events.put((agent, "done", (text, logs)))
+
+    precautions_logs, itinerary_logs = [], []
+    if ITINERARY_MODE == "per_day" and structured_weather_data:
+        itinerary_chunks = stream_itinerary_by_day(structured_weather_data, place, days, api_key, itinerary_logs, deadline=deadline)
+    else:
+        itinerary_chunks = stream_itinerary(weather_report, place, days, api_key, itinerary_logs, deadline=deadline)
+    precautions_chunks = stream_precautions(
+        weather_report, place, api_key, precautions_logs, deadline=deadline, structured_weather_data=structured_weather_data,
+    )
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        executor.submit(contextvars.copy_context().run, run, PRECAUTION_AGENT, precautions_chunks, precautions_logs)
+        executor.submit(contextvars.copy_context().run, run, ITINERARY_AGENT, itinerary_chunks, itinerary_logs)
+        remaining = 2
+        while remaining:
+            event = events.get()
+            if event[1] == "done":
+                remaining -= 1
+            yield event
+
+
+def run_pipeline(
+    query: str,
+    days: int,
+    weather_api_key: str,
+    gemini_api_key: str,
+    track_popularity: bool = True,
+    deadline: Optional[Deadline] = None,
+) -> dict:
+    """
+    Runs the full weather -> (precautions, itinerary) pipeline for one query without any UI.
+
+    Args:
+        query: The user's travel query.
+        days: The number of days for the forecast and itinerary.
+        weather_api_key: The OpenWeatherMap API key.
+        gemini_api_key: The Gemini API key.
+        track_popularity: Whether to count the destination towards the prefetcher's popularity ranking.
+        deadline: The end-to-end time budget (``PIPELINE_DEADLINE`` seconds from now by default). The
+            Weather Agent may use ``WEATHER_DEADLINE_SHARE`` of it; the follow-up agents get the rest.
+
+    Returns:
+        A dictionary with the extracted ``place``, the structured ``weather`` data, the
+        ``precautions`` and ``itinerary`` texts, the per-agent ``logs`` and the per-stage
+        ``timings`` in seconds. ``place`` is empty when no location or forecast was found.
+    """
+    deadline = deadline or Deadline(PIPELINE_DEADLINE)
+    with trace_span("pipeline"):
+        timings = {}
+        start = time.perf_counter()
+        structured_weather_data, place, weather_logs = get_weather(query, days, weather_api_key, gemini_api_key, deadline.share(WEATHER_DEADLINE_SHARE))
+        timings["weather"] = time.perf_counter() - start
+        result = {
+            "query": query,
+            "days": days,
+            "place": place,
+            "weather": structured_weather_data,
+            "precautions": "",
+            "itinerary": "",
+            "logs": {"weather": weather_logs, PRECAUTION_AGENT: [], ITINERARY_AGENT: []},
+            "timings": timings,
+        }
+        if not place or not structured_weather_data:
+            result["place"] = ""
+            timings["total"] = timings["weather"]
+            return result
+
+        if track_popularity:
+            get_popularity_tracker().record(place, days)
+        weather_report = format_weather_report(structured_weather_data, place, days)
+        followup_start = time.perf_counter()
+
+        def on_complete(agent: str, text: str, logs: list[dict]) -> None:
+            # Both agents start together, so the time to completion is each agent's own latency.
+            timings[agent] = time.perf_counter() - followup_start
+
+        for agent, (text, logs) in run_followup_agents(weather_report, place, days, gemini_api_key, on_complete=on_complete, structured_weather_data=structured_weather_data, deadline=deadline).items():
+            result[agent] = text
+            result["logs"][agent] = logs
+        timings["total"] = time.perf_counter() - start
+        return result
@@ -0,0 +1,130 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from agent1.forecast_cache import next_forecast_update
+from common.popularity import get_popularity_tracker
+from common.scheduler import GEMINI, NOMINATIM, OPENWEATHERMAP, PRIORITY_PREFETCH, request_priority
+from common.tracing import trace_span
+from orchestrator import run_pipeline
+
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", 50))
+PREFETCH_DAYS_PER_PLACE = int(os.getenv("PREFETCH_DAYS_PER_PLACE", 2))
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", 2))
+# Upstream calls one cycle may spend; it stops planning destinations once the next one could exceed them.
+PREFETCH_BUDGET = {
+    NOMINATIM: int(os.getenv("PREFETCH_BUDGET_NOMINATIM", 20)),
+    OPENWEATHERMAP: int(os.getenv("PREFETCH_BUDGET_OPENWEATHERMAP", 50)),
+    GEMINI: int(os.getenv("PREFETCH_BUDGET_GEMINI", 100)),
+}
+# Upper estimate of the calls a plan makes when nothing is cached (location extraction is usually
+# local): one precautions and one itinerary request, in either itinerary mode.
+PLAN_COST = {NOMINATIM: 1, OPENWEATHERMAP: 1, GEMINI: 2}
+# Seconds after each 3-hour forecast update before a cycle starts, so OpenWeatherMap has published it.
+PREFETCH_DELAY = float(os.getenv("PREFETCH_DELAY", 120))
+
+
+def upstream_calls(result: dict) -> dict[str, int]:
+    """Counts the upstream calls a pipeline result actually made, from the spans in its logs."""
+    calls = {upstream: 0 for upstream in PLAN_COST}
+    for logs in result["logs"].values():
+        for entry in logs:
+            span = entry.get("span")
+            if span is None or span["attributes"].get("cache_hit"):
+                continue
+            upstream = GEMINI if span["name"].startswith("gemini.") else span["name"]
+            if upstream in calls:
+                calls[upstream] += 1
+    return calls
+
+
+def _plan(place: str, days: int, weather_api_key: str, gemini_api_key: str) -> dict:
+    try:
+        return run_pipeline(place, days, weather_api_key, gemini_api_key, track_popularity=False)
+    except Exception as e:
+        return {"place": "", "logs": {}, "error": str(e)}
+
+
+def run_prefetch_cycle(
+    weather_api_key: str,
+    gemini_api_key: str,
+    top_n: int = PREFETCH_TOP_N,
+    days_per_place: int = PREFETCH_DAYS_PER_PLACE,
+    workers: int = PREFETCH_WORKERS,
+    budget: Optional[dict[str, int]] = None,
+) -> dict:
+    """
+    Plans the most popular destinations so their forecasts, precautions and itineraries are cached
+    before users ask for them.
+
+    Destinations are planned at prefetch priority, most popular first, ``workers`` at a time. A
+    round is only started if its worst-case cost fits in what is left of the budget. Destinations
+    that are still cached cost nothing.
+
+    Args:
+        weather_api_key: The OpenWeatherMap API key.
+        gemini_api_key: The Gemini API key.
+        top_n: The number of destinations to warm.
+        days_per_place: The number of most requested ``days`` values to warm per destination.
+        workers: The number of plans run concurrently.
+        budget: Upstream calls allowed per upstream (defaults to ``PREFETCH_BUDGET``).
+
+    Returns:
+        A summary with the number of ``planned``, ``failed`` and ``skipped`` plans and the upstream ``calls`` spent.
+    """
+    budget = budget or PREFETCH_BUDGET
+    tracker = get_popularity_tracker()
+    tracker.prune()
+    jobs = [(place, days) for place, days_values in tracker.top(top_n, days_per_place) for days in days_values]
+    stats = {"planned": 0, "failed": 0, "skipped": 0, "calls": {upstream: 0 for upstream in PLAN_COST}}
+
+    with request_priority(PRIORITY_PREFETCH), trace_span("prefetch") as span, ThreadPoolExecutor(max_workers=workers) as executor:
+        next_job = 0
+        while next_job < len(jobs):
+            affordable = min((budget.get(upstream, 0) - stats["calls"][upstream]) // cost for upstream, cost in PLAN_COST.items())
+            round_jobs = jobs[next_job:next_job + max(0, min(workers, affordable))]
+            if not round_jobs:
+                stats["skipped"] = len(jobs) - next_job
+                break
+            next_job += len(round_jobs)
+            futures = [
+                executor.submit(contextvars.copy_context().run, _plan, place, days, weather_api_key, gemini_api_key)
+                for place, days in round_jobs
+            ]
+            for future in futures:
+                result = future.result()
+                for upstream, count in upstream_calls(result).items():
+                    stats["calls"][upstream] += count
+                failed = not result["place"] or any(entry["status"] == "error" for logs in result["logs"].values() for entry in logs)
+                stats["failed" if failed else "planned"] += 1
+        span.set(**{key: value for key, value in stats.items() if key != "calls"})
+    return stats
+
+
+def run_prefetcher(
+    weather_api_key: str,
+    gemini_api_key: str,
+    stop: Optional[threading.Event] = None,
+    **cycle_options,
+) -> None:
+    """
+    Runs a prefetch cycle now and then shortly after every 3-hour forecast update, until ``stop`` is set.
+    """
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        stats = run_prefetch_cycle(weather_api_key, gemini_api_key, **cycle_options)
+        print(f"Prefetch: {stats['planned']} planned, {stats['failed']} failed, {stats['skipped']} skipped over budget; upstream calls {stats['calls']}")
+        stop.wait(max(0.0, next_forecast_update() + PREFETCH_DELAY - time.time()))
+
+
+def start_prefetcher(weather_api_key: str, gemini_api_key: str, **cycle_options) -> tuple[threading.Thread, threading.Event]:
+    """Starts ``run_prefetcher`` on a daemon thread and returns it with the event that stops it."""
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=run_prefetcher, args=(weather_api_key, gemini_api_key, stop), kwargs=cycle_options, name="prefetcher", daemon=True,
+    )
+    thread.start()
+    return thread, stop
@@ -0,0 +1,189 @@
+import asyncio
+import contextvars
+import json
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional
+
+from agent1.geocode_cache import normalize_place_name
+from agent1.location_extractor import LOCAL_EXTRACTION_MIN_CONFIDENCE, extract_location_locally
+from common.metrics import REGISTRY
+from orchestrator import run_pipeline
+
+MAX_BODY_BYTES = 64 * 1024
+MAX_DAYS = 5
+KEEP_ALIVE_TIMEOUT = 15.0
+SERVICE_MAX_CONCURRENCY = int(os.getenv("SERVICE_MAX_CONCURRENCY", "8"))
+SERVICE_MAX_PENDING = int(os.getenv("SERVICE_MAX_PENDING", "64"))
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+REGISTRY.describe("service_requests_total", "HTTP requests served by the plan service, by path and status.")
+REGISTRY.describe("service_singleflight_shared_total", "Plan requests answered by joining an identical in-flight computation.")
+REGISTRY.describe("service_pending_plans", "Distinct plans waiting for a free pipeline slot.")
+
+
+class Overloaded(Exception):
+    """Raised when the service already has as many plans waiting as it is allowed to queue."""
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into a single computation.
+
+    The computation runs in its own task, so it is not cancelled when the caller that started
+    it goes away; every caller awaits the shared result.
+    """
+
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: str, function: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """Returns ``(result, shared)``, where ``shared`` is true if an identical call was already running."""
+        task = self._inflight.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(function())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task), shared
+
+
+def plan_key(query: str, days: int) -> str:
+    """
+    Normalizes a plan request to ``place|days``. The place comes from the local extractor when it
+    is confident, so "trip to Kochi" and "visit kochi" share a key; otherwise the normalized query is used.
+    """
+    place, confidence = extract_location_locally(query)
+    if not place or confidence < LOCAL_EXTRACTION_MIN_CONFIDENCE:
+        place = query
+    return f"{normalize_place_name(place)}|{days}"
+
+
+class PlanService:
+    """
+    An asyncio JSON API around the three agents.
+
+    ``POST /plan`` with ``{"query": ..., "days": ...}`` returns the structured weather, precautions,
+    itinerary, logs and timings. ``GET /healthz`` and ``GET /metrics`` (Prometheus text) are also served.
+
+    Args:
+        weather_api_key: The OpenWeatherMap API key.
+        gemini_api_key: The Gemini API key.
+        max_concurrency: The number of pipelines computed at the same time.
+        max_pending: The number of distinct plans allowed to wait for a free slot before new
+            ones are rejected with 503.
+    """
+
+    def __init__(self, weather_api_key: str, gemini_api_key: str, max_concurrency: int = SERVICE_MAX_CONCURRENCY, max_pending: int = SERVICE_MAX_PENDING):
+        self.weather_api_key = weather_api_key
+        self.gemini_api_key = gemini_api_key
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="plan")
+        self.single_flight = SingleFlight()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+
+    async def plan(self, query: str, days: int) -> dict:
+        result, shared = await self.single_flight.do(plan_key(query, days), lambda: self._compute(query, days))
+        if shared:
+            REGISTRY.increment("service_singleflight_shared_total")
+        return {**result, "shared": shared}
+
+    async def _compute(self, query: str, days: int) -> dict:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        if self._slots.locked() and self._waiting >= self.max_pending:
+            raise Overloaded(f"Too many plans in progress ({self.max_concurrency} running, {self._waiting} waiting).")
+        self._waiting += 1
+        REGISTRY.set_gauge("service_pending_plans", self._waiting)
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+            REGISTRY.set_gauge("service_pending_plans", self._waiting)
+        try:
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(self.executor, context.run, run_pipeline, query, days, self.weather_api_key, self.gemini_api_key)
+        finally:
+            self._slots.release()
+
+    async def route(self, method: str, path: str, body: bytes) -> tuple[int, str, bytes]:
+        """Returns ``(status, content_type, body)`` for a request."""
+        if path == "/healthz":
+            return 200, "application/json", json.dumps({"status": "ok", "in_flight": len(self.single_flight)}).encode()
+        if path == "/metrics":
+            return 200, "text/plain; version=0.0.4", REGISTRY.to_prometheus().encode()
+        if path != "/plan":
+            return 404, "application/json", json.dumps({"error": f"Unknown path '{path}'"}).encode()
+        if method != "POST":
+            return 405, "application/json", json.dumps({"error": "Use POST /plan"}).encode()
+        try:
+            request = json.loads(body or b"{}")
+            query = request["query"]
+            days = int(request.get("days", 3))
+            if not isinstance(query, str) or not query.strip() or not 1 <= days <= MAX_DAYS:
+                raise ValueError(f"'query' must be a non-empty string and 'days' between 1 and {MAX_DAYS}")
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, "application/json", json.dumps({"error": f"Invalid request: {e}"}).encode()
+        try:
+            result = await self.plan(query, days)
+        except Overloaded as e:
+            return 503, "application/json", json.dumps({"error": str(e)}).encode()
+        except Exception as e:
+            # e.g. a locked or corrupt cache database: answer the client instead of dropping the connection.
+            traceback.print_exc()
+            return 500, "application/json", json.dumps({"error": f"Could not build the plan: {e}"}).encode()
+        return 200, "application/json", json.dumps(result, ensure_ascii=False).encode("utf-8")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serves HTTP/1.1 requests on one connection, keeping it alive between requests."""
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line.strip():
+                    break
+                method, path, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    status, content_type, payload = 413, "application/json", b'{"error": "Request body too large"}'
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, content_type, payload = await self.route(method.upper(), path.split("?", 1)[0], body)
+                    keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                REGISTRY.increment("service_requests_total", {"path": path.split("?", 1)[0], "status": status})
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1")
+                    + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            # Malformed request line or the client went away mid-request.
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "0.0.0.0", port: int = 8080) -> None:
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Plan service listening on http://{host}:{port} (max {self.max_concurrency} concurrent plans)")
+        async with server:
+            await server.serve_forever()
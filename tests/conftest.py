@@ -0,0 +1,19 @@
+import json
+
+import pytest
+
+from benchmarks.run import FAKE_KEY, SCENARIOS_PATH, install_fakes, uninstall_fakes
+
+
+@pytest.fixture
+def offline():
+    """
+    Points the agents at the benchmark fakes (default latencies, no errors) with fresh in-memory
+    caches and no rate limits, and returns the key to pass as every API key. Tests may install
+    their own session or model on top; everything is restored afterwards.
+    """
+    with open(SCENARIOS_PATH, encoding="utf-8") as scenarios_file:
+        defaults = json.load(scenarios_file)["defaults"]
+    install_fakes({**defaults, "caches": True})
+    yield FAKE_KEY
+    uninstall_fakes()
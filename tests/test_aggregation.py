@@ -0,0 +1,91 @@
+from datetime import datetime, timezone
+
+from agent1.aggregation import aggregate_daily_forecasts, weather_category
+
+# Kochi is UTC+05:30.
+IST = 19800
+
+
+def _slot(iso_time: str, temp: float, description: str, rain: float = 0.0) -> dict:
+    slot = {
+        "dt": int(datetime.fromisoformat(iso_time).replace(tzinfo=timezone.utc).timestamp()),
+        "main": {"temp": temp},
+        "weather": [{"description": description}],
+        "wind": {"speed": temp / 10},
+    }
+    if rain:
+        slot["rain"] = {"3h": rain}
+    return slot
+
+
+def test_days_are_split_at_local_midnight():
+    payload = {
+        "city": {"timezone": IST},
+        "list": [
+            _slot("2025-01-01T15:00:00", 26.0, "light rain", rain=1.5),  # 20:30 local, Jan 1
+            _slot("2025-01-01T18:00:00", 24.0, "clear sky"),  # 23:30 local, Jan 1
+            _slot("2025-01-01T21:00:00", 22.0, "overcast clouds"),  # 02:30 local, Jan 2
+            _slot("2025-01-02T00:00:00", 23.0, "overcast clouds", rain=0.5),  # 05:30 local, Jan 2
+        ],
+    }
+
+    [daily] = aggregate_daily_forecasts([payload])
+
+    assert [day["date"] for day in daily] == ["2025-01-01", "2025-01-02"]
+    first, second = daily
+    assert (first["min_temp"], first["max_temp"], first["mean_temp"]) == (24.0, 26.0, 25.0)
+    assert first["precipitation_mm"] == 1.5
+    assert first["max_wind_speed"] == 2.6
+    assert (second["min_temp"], second["max_temp"]) == (22.0, 23.0)
+    assert second["precipitation_mm"] == 0.5
+    assert second["description"] == "overcast clouds"
+
+
+def test_description_ties_go_to_the_first_one_in_the_day():
+    # "clear sky" sorts before "light rain", so a tie must not be broken alphabetically.
+    payload = {
+        "city": {"timezone": IST},
+        "list": [
+            _slot("2025-01-01T00:00:00", 25.0, "light rain"),
+            _slot("2025-01-01T03:00:00", 27.0, "clear sky"),
+            _slot("2025-01-01T06:00:00", 28.0, "clear sky"),
+            _slot("2025-01-01T09:00:00", 26.0, "light rain"),
+        ],
+    }
+
+    [daily] = aggregate_daily_forecasts([payload])
+
+    assert daily[0]["description"] == "light rain"
+
+
+def test_the_most_frequent_description_wins_over_the_first():
+    payload = {
+        "city": {"timezone": 0},
+        "list": [
+            _slot("2025-01-01T00:00:00", 25.0, "light rain"),
+            _slot("2025-01-01T03:00:00", 27.0, "clear sky"),
+            _slot("2025-01-01T06:00:00", 28.0, "clear sky"),
+        ],
+    }
+
+    [daily] = aggregate_daily_forecasts([payload])
+
+    assert daily[0]["description"] == "clear sky"
+
+
+def test_locations_are_aggregated_separately_and_trimmed_to_days():
+    utc = {"city": {"timezone": 0}, "list": [_slot("2025-01-01T21:00:00", 10.0, "snow"), _slot("2025-01-02T00:00:00", 12.0, "snow")]}
+    ist = {"city": {"timezone": IST}, "list": [_slot("2025-01-01T21:00:00", 30.0, "haze")]}
+
+    utc_daily, ist_daily, empty = aggregate_daily_forecasts([utc, ist, {"list": []}], days=1)
+
+    assert [(day["date"], day["max_temp"]) for day in utc_daily] == [("2025-01-01", 10.0)]
+    assert [(day["date"], day["description"]) for day in ist_daily] == [("2025-01-02", "haze")]
+    assert empty == []
+
+
+def test_weather_category():
+    assert weather_category("Thunderstorm with light rain") == "storm"
+    assert weather_category("light rain") == "rain"
+    assert weather_category("broken clouds") == "clouds"
+    assert weather_category("volcanic activity") == "other"
@@ -0,0 +1,79 @@
+import json
+import time
+
+import batch
+from batch import load_completed, run_batch
+from benchmarks.fakes import FakeGeminiModel
+from common.clients import install_gemini_model_factory
+
+
+def _write_records(path, records: list[dict]) -> None:
+    path.write_text("".join(json.dumps(record) + "\n" for record in records), encoding="utf-8")
+
+
+def _read_results(path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+
+def _install_gemini(error_rate: float) -> None:
+    model = FakeGeminiModel({"error_rate": error_rate, "output_chars": 200, "chunks": 2})
+    install_gemini_model_factory(lambda api_key, model_name: model)
+
+
+def test_failed_generation_is_an_error_and_is_retried_on_resume(offline, tmp_path):
+    input_path, output_path = tmp_path / "queries.jsonl", tmp_path / "results.jsonl"
+    _write_records(input_path, [{"query": "trip to Kochi", "days": 2}, {"query": "trip to Paris", "days": 1}])
+
+    _install_gemini(error_rate=1.0)
+    stats = run_batch(str(input_path), str(output_path), offline, offline, workers=2)
+    assert (stats["ok"], stats["error"], stats["skipped"]) == (0, 2, 0)
+    results = _read_results(output_path)
+    assert all(result["place"] for result in results)
+    assert all("itinerary: " in result["error"] for result in results)
+    assert load_completed(str(output_path)) == set()
+
+    _install_gemini(error_rate=0.0)
+    stats = run_batch(str(input_path), str(output_path), offline, offline, workers=2)
+    assert (stats["ok"], stats["error"], stats["skipped"]) == (2, 0, 0)
+
+    stats = run_batch(str(input_path), str(output_path), offline, offline, workers=2)
+    assert (stats["ok"], stats["error"], stats["skipped"]) == (0, 0, 2)
+    assert [result["status"] for result in _read_results(output_path)] == ["error", "error", "ok", "ok"]
+
+
+def test_invalid_records_are_reported_without_stopping_the_batch(offline, tmp_path):
+    input_path, output_path = tmp_path / "queries.jsonl", tmp_path / "results.jsonl"
+    input_path.write_text('{"query": "trip to Kochi", "days": 1}\nnot json\n{"query": "", "days": 1}\n', encoding="utf-8")
+
+    stats = run_batch(str(input_path), str(output_path), offline, offline)
+
+    assert (stats["ok"], stats["error"]) == (1, 2)
+    assert sorted(result["line"] for result in _read_results(output_path)) == [1, 2, 3]
+
+
+def test_resume_ignores_a_truncated_last_line(offline, tmp_path):
+    input_path, output_path = tmp_path / "queries.jsonl", tmp_path / "results.jsonl"
+    _write_records(input_path, [{"query": "trip to Kochi", "days": 1}])
+    output_path.write_text('{"line": 1, "status": "ok", "query": "trip to Ko', encoding="utf-8")
+
+    stats = run_batch(str(input_path), str(output_path), offline, offline)
+
+    assert (stats["ok"], stats["skipped"]) == (1, 0)
+    assert json.loads(output_path.read_text(encoding="utf-8").splitlines()[-1])["status"] == "ok"
+
+
+def test_last_records_are_written_as_they_finish(offline, tmp_path, monkeypatch):
+    input_path, output_path = tmp_path / "queries.jsonl", tmp_path / "results.jsonl"
+    _write_records(input_path, [{"query": "trip to Kochi", "days": 1}, {"query": "trip to Paris", "days": 1}])
+    written_while_slow_record_ran = []
+
+    def plan_record(line_number, record, *keys):
+        if line_number == 1:
+            time.sleep(0.3)
+            written_while_slow_record_ran.extend(_read_results(output_path))
+        return {"line": line_number, **record, "status": "ok"}
+
+    monkeypatch.setattr(batch, "plan_record", plan_record)
+    run_batch(str(input_path), str(output_path), offline, offline, workers=2)
+
+    assert [result["line"] for result in written_while_slow_record_ran] == [2]
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import pytest
+
+import common.cache as cache_module
+from common.cache import LRUCache, SQLiteCache, TieredCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def disk(tmp_path):
+    return SQLiteCache(str(tmp_path / "cache.sqlite"), ttl=3600)
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_memory_entries_expire_after_their_ttl(clock):
+    cache = TieredCache(LRUCache(ttl=60))
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=300)
+
+    clock.now += 61
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    clock.now += 300
+    assert cache.get("b") is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_entries_evicted_from_memory_are_served_from_disk(clock, disk):
+    cache = TieredCache(LRUCache(max_entries=1, ttl=3600), disk)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    assert cache.get("a") == 1
+    assert cache.get("a") == 1
+    assert cache.stats() == {"memory_hits": 1, "disk_hits": 1, "misses": 0, "memory_entries": 1}
+
+
+def test_disk_hits_are_promoted_with_their_remaining_lifetime(clock, disk):
+    cache = TieredCache(LRUCache(ttl=3600), disk)
+    cache.set("a", 1, ttl=100)
+    cache.memory.clear()
+
+    clock.now += 60
+    assert cache.get("a") == 1
+    assert cache.memory.get_entry("a") == (1, 1_000_100.0)
+    clock.now += 41
+    assert cache.get("a") is None
+    assert disk.get("a") is None
+
+
+def test_explicit_expiry_applies_to_both_tiers(clock, disk):
+    cache = TieredCache(LRUCache(ttl=3600), disk)
+    cache.set("a", 1, expires_at=clock.now + 10)
+
+    clock.now += 11
+    assert cache.memory.get("a") is None
+    assert disk.get("a") is None
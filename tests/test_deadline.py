@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+
+from common.deadline import MIN_TIMEOUT, Deadline, DeadlineExceeded, hedged_call
+from common.metrics import REGISTRY
+
+
+def _counter(name: str, labels: dict) -> float:
+    series = REGISTRY.to_dict()["counters"].get(name, [])
+    return sum(entry["value"] for entry in series if entry["labels"] == labels)
+
+
+def test_hedged_call_gives_up_at_the_deadline():
+    before = _counter("deadline_exceeded_total", {"upstream": "test.slow"})
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        hedged_call("test.slow", lambda: time.sleep(1), Deadline(0.1))
+
+    assert time.monotonic() - start < 0.5
+    assert _counter("deadline_exceeded_total", {"upstream": "test.slow"}) == before + 1
+
+
+def test_hedged_call_does_not_start_after_the_deadline():
+    calls = []
+    deadline = Deadline(0)
+
+    with pytest.raises(DeadlineExceeded):
+        hedged_call("test.expired", lambda: calls.append(1), deadline)
+    assert calls == []
+
+
+def test_result_abandoned_at_the_deadline_is_discarded():
+    discarded = threading.Event()
+
+    def slow() -> str:
+        time.sleep(0.2)
+        return "late"
+
+    with pytest.raises(DeadlineExceeded):
+        hedged_call("test.discard", slow, Deadline(0.05), discard=lambda result: discarded.set() if result == "late" else None)
+
+    assert discarded.wait(1)
+
+
+def test_hedged_call_returns_within_the_deadline():
+    assert hedged_call("test.fast", lambda: 42, Deadline(1)) == 42
+
+
+def test_errors_are_raised_before_the_deadline():
+    def fail() -> None:
+        raise ValueError("bad reply")
+
+    with pytest.raises(ValueError, match="bad reply"):
+        hedged_call("test.error", fail, Deadline(1))
+
+
+def test_deadline_timeout_is_capped_by_the_remaining_time():
+    assert Deadline().timeout(30) == 30
+    assert Deadline(5).timeout(30) == pytest.approx(5, abs=0.1)
+    assert Deadline(0).timeout(30) == MIN_TIMEOUT
+
+
+def _slow_then_fast(first_seconds: float):
+    calls = []
+    lock = threading.Lock()
+
+    def call() -> str:
+        with lock:
+            calls.append(1)
+            attempt = len(calls)
+        if attempt == 1:
+            time.sleep(first_seconds)
+            return "first"
+        return "duplicate"
+    return call, calls
+
+
+@pytest.fixture
+def hedged_kind():
+    # Enough fast samples for the kind to be hedged after about 10 ms.
+    kind = f"test.hedge.{time.monotonic_ns()}"
+    for _ in range(20):
+        REGISTRY.observe("upstream_latency_seconds", 0.01, {"upstream": kind})
+    return kind
+
+
+def test_slow_call_is_hedged_when_a_slot_is_free(hedged_kind):
+    call, calls = _slow_then_fast(0.5)
+
+    start = time.monotonic()
+    assert hedged_call(hedged_kind, call, Deadline(2), hedge_slot=lambda: True) == "duplicate"
+    assert time.monotonic() - start < 0.3
+    assert len(calls) == 2
+    assert _counter("hedged_requests_total", {"upstream": hedged_kind}) == 1
+
+
+def test_hedge_is_skipped_without_a_free_slot(hedged_kind):
+    call, calls = _slow_then_fast(0.1)
+
+    assert hedged_call(hedged_kind, call, Deadline(2), hedge_slot=lambda: False) == "first"
+    assert len(calls) == 1
+    assert _counter("hedges_skipped_total", {"upstream": hedged_kind}) == 1
+
+
+def test_calls_without_a_hedge_slot_are_never_duplicated(hedged_kind):
+    call, calls = _slow_then_fast(0.1)
+
+    assert hedged_call(hedged_kind, call, Deadline(2)) == "first"
+    assert len(calls) == 1
@@ -0,0 +1,104 @@
+import time
+
+import pytest
+import requests
+
+import agent1.forecast_cache as forecast_cache_module
+from agent1.weather_agent import _fetch_forecast
+from agent2.precaution_agent import get_precautions, rule_based_precautions
+from common.clients import install_gemini_model_factory, install_http_session
+from common.deadline import Deadline
+
+LAT, LON = "9.9312", "76.2673"
+
+
+class FailingSession:
+    def get(self, url, params=None, timeout=None, **kwargs):
+        raise requests.exceptions.ConnectionError(f"Connection refused: {url}")
+
+
+class FailingModel:
+    def generate_content(self, prompt, stream=False, request_options=None):
+        raise RuntimeError("503 The model is overloaded.")
+
+
+def _day(date: str, weather: str, high: float, low: float, precipitation: float = 0.0, wind: float = 2.0) -> dict:
+    return {
+        "Date": date,
+        "Weather": weather,
+        "High Temp (°C)": f"{high:.2f}",
+        "Low Temp (°C)": f"{low:.2f}",
+        "Precipitation (mm)": f"{precipitation:.1f}",
+        "Max Wind (m/s)": f"{wind:.1f}",
+    }
+
+
+def _cache_superseded_forecast(monkeypatch, slot_times: list[int]) -> None:
+    """Caches a forecast for the test cell that a newer forecast update has already replaced."""
+    monkeypatch.setattr(forecast_cache_module, "next_forecast_update", lambda: time.time() - 1)
+    payload = {
+        "city": {"timezone": 19800},
+        "list": [{"dt": dt, "main": {"temp": 28.0}, "weather": [{"description": "light rain"}]} for dt in slot_times],
+    }
+    forecast_cache_module.get_forecast_cache().set(LAT, LON, payload)
+
+
+def test_stale_forecast_is_used_when_openweathermap_fails(offline, monkeypatch):
+    now = int(time.time())
+    _cache_superseded_forecast(monkeypatch, [now - 4 * 3600, now + 3600, now + 4 * 3600])
+    install_http_session(FailingSession())
+    logs = []
+
+    weather_data = _fetch_forecast(LAT, LON, offline, logs, Deadline(5))
+
+    # The slot that is already over is dropped.
+    assert [slot["dt"] for slot in weather_data["list"]] == [now + 3600, now + 4 * 3600]
+    assert any(entry["step"] == "Using stale forecast" for entry in logs)
+
+
+def test_failure_without_a_stale_forecast_is_raised(offline):
+    install_http_session(FailingSession())
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        _fetch_forecast(LAT, LON, offline, [], Deadline(5))
+
+
+def test_rule_based_precautions():
+    precautions = rule_based_precautions([
+        _day("2025-01-01", "Light rain", 31.0, 24.0, precipitation=2.0),
+        _day("2025-01-02", "Thunderstorm with heavy rain", 29.0, 23.0, precipitation=25.0, wind=12.0),
+        _day("2025-01-03", "Light snow", 1.0, -3.0),
+    ], "Kochi")
+
+    assert precautions.startswith("Basic precautions for Kochi")
+    assert "- Hot weather: stay hydrated, wear sunscreen and avoid strenuous activity around midday. (2025-01-01)" in precautions
+    assert "- Heavy rain: watch for flooding and check transport before setting out. (2025-01-02)" in precautions
+    assert "- Rain: carry an umbrella or a rain jacket. (2025-01-01)" in precautions
+    assert "Strong winds" in precautions and "Thunderstorms" in precautions
+    assert "Frost is likely" in precautions and "Snow:" in precautions
+
+
+def test_rule_based_precautions_without_risks():
+    precautions = rule_based_precautions([_day("2025-01-01", "Clear sky", 24.0, 16.0)], "Lisbon")
+
+    assert "No weather-related risks stand out" in precautions
+
+
+def test_precautions_fall_back_to_rules_when_gemini_fails(offline):
+    install_gemini_model_factory(lambda api_key, model_name: FailingModel())
+    daily = [_day("2025-01-01", "Light rain", 29.0, 23.0, precipitation=2.0)]
+
+    precautions, logs = get_precautions("Light rain", "Kochi", offline, structured_weather_data=daily)
+
+    assert precautions == rule_based_precautions(daily, "Kochi")
+    assert any(entry["step"] == "Rule-based precautions fallback" for entry in logs)
+    assert not any(entry["status"] == "error" for entry in logs)
+
+
+def test_precautions_report_the_error_without_a_forecast(offline):
+    install_gemini_model_factory(lambda api_key, model_name: FailingModel())
+
+    precautions, logs = get_precautions("Light rain", "Kochi", offline)
+
+    assert precautions.startswith("An error occurred while generating precautions")
+    assert any(entry["status"] == "error" for entry in logs)
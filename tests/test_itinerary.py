@@ -0,0 +1,108 @@
+from agent3.itinerary_agent import DAY_MARKER_INSTRUCTION, _split_day_plans, get_itinerary_by_day
+from agent3.segment_cache import ITINERARY_TEMP_THRESHOLD, day_summary, get_segment_cache, summary_changed
+from benchmarks.fakes import FakeGeminiModel
+from common.clients import install_gemini_model_factory
+
+DATES = ["2025-01-01", "2025-01-02", "2025-01-03"]
+
+
+class ScriptedModel(FakeGeminiModel):
+    """Answers the multi-day prompt with ``reply`` and any other (single-prompt) itinerary with ``FULL``."""
+
+    def __init__(self, reply: str):
+        super().__init__()
+        self.reply = reply
+        self.prompts = []
+
+    def chunks(self, prompt: str) -> list[str]:
+        self.prompts.append(prompt)
+        return [self.reply] if DAY_MARKER_INSTRUCTION in prompt else ["FULL"]
+
+
+def _install(model: FakeGeminiModel) -> FakeGeminiModel:
+    install_gemini_model_factory(lambda api_key, model_name: model)
+    return model
+
+
+def _day(date: str, weather: str = "Light rain", high: float = 29.5, low: float = 23.0) -> dict:
+    return {"Date": date, "Weather": weather, "High Temp (°C)": f"{high:.2f}", "Low Temp (°C)": f"{low:.2f}", "Precipitation (mm)": "1.5", "Max Wind (m/s)": "4.0"}
+
+
+def test_split_tolerates_decorated_markers():
+    reply = (
+        "Here is your plan!\n"
+        "**=== 2025-01-01 (Wednesday) ===**\nMuseum in the morning.\n"
+        "=== Day 2 ===\nNo date in this marker.\n"
+        "### === 2025-01-03 ===\nBeach.\n"
+    )
+
+    assert _split_day_plans(reply, DATES) == {"2025-01-01": "Museum in the morning.", "2025-01-03": "Beach."}
+
+
+def test_summary_changed_thresholds():
+    old = day_summary(_day("2025-01-01"))
+
+    assert not summary_changed(old, day_summary(_day("2025-01-01", high=29.5 + ITINERARY_TEMP_THRESHOLD)))
+    assert summary_changed(old, day_summary(_day("2025-01-01", high=29.5 + ITINERARY_TEMP_THRESHOLD + 0.1)))
+    assert summary_changed(old, day_summary(_day("2025-01-01", low=23.0 - ITINERARY_TEMP_THRESHOLD - 0.1)))
+    assert summary_changed(old, day_summary(_day("2025-01-01", weather="Clear sky")))
+    assert not summary_changed(old, day_summary(_day("2025-01-01", weather="Moderate rain")))
+
+
+def test_only_changed_days_are_regenerated_in_one_request(offline):
+    model = _install(ScriptedModel("".join(f"=== {date} ===\nPlan for {date}, first forecast.\n" for date in DATES)))
+    get_itinerary_by_day([_day(date) for date in DATES], "Kochi", 3, offline)
+
+    model.reply = "=== 2025-01-02 ===\nPlan for 2025-01-02, now sunny.\n"
+    weather = [_day("2025-01-01", high=30.5), _day("2025-01-02", weather="Clear sky"), _day("2025-01-03")]
+    itinerary, logs = get_itinerary_by_day(weather, "Kochi", 3, offline)
+
+    assert len(model.prompts) == 2
+    assert "2025-01-01" not in model.prompts[1] and "2025-01-02" in model.prompts[1]
+    assert "Plan for 2025-01-01, first forecast." in itinerary
+    assert "Plan for 2025-01-02, now sunny." in itinerary
+    assert "### Day 3: 2025-01-03" in itinerary
+    assert not any(entry["status"] == "error" for entry in logs)
+
+
+def test_malformed_reply_keeps_parsed_days_and_writes_the_rest_with_the_single_prompt(offline):
+    model = _install(ScriptedModel("**=== 2025-01-01 (Wednesday) ===**\nMuseum.\n=== Thursday ===\nLost.\n=== 2025-01-03 ===\nBeach.\n"))
+
+    itinerary, logs = get_itinerary_by_day([_day(date) for date in DATES], "Kochi", 3, offline)
+
+    assert itinerary.index("Museum.") < itinerary.index("### Days 2: 2025-01-02\n\nFULL") < itinerary.index("Beach.")
+    assert "Please create a 1-day travel itinerary" in model.prompts[1]
+    assert not any(entry["status"] == "error" for entry in logs)
+    segment_cache = get_segment_cache()
+    assert segment_cache.get("Kochi", "2025-01-01")["text"] == "Museum."
+    assert segment_cache.get("Kochi", "2025-01-02") is None
+    assert segment_cache.get("Kochi", "2025-01-03")["text"] == "Beach."
+
+
+def test_days_missing_from_the_reply_use_their_outdated_plans(offline):
+    get_segment_cache().set("Kochi", "2025-01-02", day_summary(_day("2025-01-02", weather="Snow")), "Old plan.")
+    model = _install(ScriptedModel("=== 2025-01-01 ===\nMuseum.\n=== 2025-01-03 ===\nBeach.\n"))
+
+    itinerary, logs = get_itinerary_by_day([_day(date) for date in DATES], "Kochi", 3, offline)
+
+    assert "### Day 2: 2025-01-02 (Light rain, 23-30°C)\n\nOld plan." in itinerary
+    assert len(model.prompts) == 1
+    assert any(entry["step"] == "Day plans missing from reply" for entry in logs)
+
+
+def test_single_day_needs_no_marker(offline):
+    _install(ScriptedModel("Museum, then the beach."))
+
+    itinerary, _ = get_itinerary_by_day([_day("2025-01-01")], "Kochi", 1, offline)
+
+    assert itinerary == "### Day 1: 2025-01-01 (Light rain, 23-30°C)\n\nMuseum, then the beach.\n\n"
+
+
+def test_day_plans_are_not_reused_without_the_cache(offline):
+    model = _install(ScriptedModel("=== 2025-01-01 ===\nMuseum.\n"))
+
+    get_itinerary_by_day([_day("2025-01-01")], "Kochi", 1, offline, use_cache=False)
+    get_itinerary_by_day([_day("2025-01-01")], "Kochi", 1, offline, use_cache=False)
+
+    assert len(model.prompts) == 2
+    assert get_segment_cache().get("Kochi", "2025-01-01") is None
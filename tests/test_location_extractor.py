@@ -0,0 +1,46 @@
+import pytest
+
+from agent1.location_extractor import LOCAL_EXTRACTION_MIN_CONFIDENCE, PARTIAL_MATCH_CONFIDENCE, PlaceTrie, extract_location_locally
+
+
+@pytest.mark.parametrize("query, place, confidence", [
+    ("I am planning a trip to Kochi", "Kochi", 0.95),
+    ("trip to New York next month", "New York", 0.95),
+    ("Kochi next week", "Kochi", 0.85),
+    ("things to do in são paulo", "Sao Paulo", 0.85),
+])
+def test_single_gazetteer_match_is_confident(query, place, confidence):
+    assert extract_location_locally(query) == (place, confidence)
+    assert confidence >= LOCAL_EXTRACTION_MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("query, place", [
+    ("weather in New Mexico", "Mexico"),
+    ("visit Paris, Texas", "Paris"),
+    ("Santiago de Compostela in spring", "Santiago"),
+])
+def test_match_inside_a_longer_name_falls_back(query, place):
+    assert extract_location_locally(query) == (place, PARTIAL_MATCH_CONFIDENCE)
+    assert PARTIAL_MATCH_CONFIDENCE < LOCAL_EXTRACTION_MIN_CONFIDENCE
+
+
+def test_capitalized_trigger_phrase_is_not_part_of_the_name():
+    assert extract_location_locally("Visit Paris in the spring") == ("Paris", 0.95)
+
+
+def test_several_places_fall_back():
+    assert extract_location_locally("trip to Kochi or Munnar") == ("Kochi", 0.5)
+
+
+def test_unknown_place_after_a_trigger_falls_back():
+    assert extract_location_locally("vacation in Zzyzx") == ("Zzyzx", 0.6)
+
+
+def test_no_place():
+    assert extract_location_locally("hello there") == ("", 0.0)
+
+
+def test_trie_prefers_the_longest_match():
+    trie = PlaceTrie(["York", "New York", "New York City"])
+
+    assert trie.find_all("from New York City to York") == [("New York City", 5, 18), ("York", 22, 26)]
@@ -0,0 +1,193 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from common.clients import build_http_session
+from common.deadline import Deadline, DeadlineExceeded
+from common.scheduler import (
+    GEMINI,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_PREFETCH,
+    RATE_LIMIT_BACKOFF,
+    Scheduler,
+    UpstreamLimiter,
+    UpstreamOverloaded,
+    install_scheduler,
+    upstream_call,
+)
+
+
+@pytest.fixture
+def limiter():
+    limiter = UpstreamLimiter("test", rate=20, burst=1, max_wait=5)
+    # Spend the burst, so the next slot opens in 50 ms and requests have to queue for it.
+    assert limiter.try_acquire()
+    return limiter
+
+
+@pytest.fixture
+def gemini_limiter():
+    limiter = UpstreamLimiter(GEMINI, rate=100, burst=5)
+    install_scheduler(Scheduler({GEMINI: limiter}))
+    yield limiter
+    install_scheduler(None)
+
+
+def _wait_for_queue(limiter: UpstreamLimiter, depth: int) -> None:
+    give_up_at = time.monotonic() + 2
+    while len(limiter._queue) < depth:
+        assert time.monotonic() < give_up_at, "request never queued"
+        time.sleep(0.001)
+
+
+def test_interactive_requests_overtake_queued_prefetch(limiter):
+    granted = []
+
+    def acquire(name: str, priority: int) -> None:
+        limiter.acquire(priority=priority)
+        granted.append(name)
+
+    prefetch = threading.Thread(target=acquire, args=("prefetch", PRIORITY_PREFETCH))
+    prefetch.start()
+    _wait_for_queue(limiter, 1)
+    interactive = threading.Thread(target=acquire, args=("interactive", PRIORITY_INTERACTIVE))
+    interactive.start()
+    _wait_for_queue(limiter, 2)
+    prefetch.join(2)
+    interactive.join(2)
+
+    assert granted == ["interactive", "prefetch"]
+
+
+def test_same_priority_is_served_in_arrival_order(limiter):
+    granted = []
+
+    def acquire(name: str) -> None:
+        limiter.acquire(priority=PRIORITY_INTERACTIVE)
+        granted.append(name)
+
+    threads = []
+    for depth, name in enumerate(["first", "second", "third"], start=1):
+        thread = threading.Thread(target=acquire, args=(name,))
+        thread.start()
+        threads.append(thread)
+        _wait_for_queue(limiter, depth)
+    for thread in threads:
+        thread.join(2)
+
+    assert granted == ["first", "second", "third"]
+
+
+def test_full_queue_sheds_new_requests():
+    limiter = UpstreamLimiter("test", rate=20, burst=1, max_queue=1)
+    assert limiter.try_acquire()
+    waiter = threading.Thread(target=limiter.acquire)
+    waiter.start()
+    _wait_for_queue(limiter, 1)
+
+    with pytest.raises(UpstreamOverloaded, match="already waiting"):
+        limiter.acquire()
+    waiter.join(2)
+
+
+def test_request_is_shed_when_estimated_wait_exceeds_max_wait():
+    limiter = UpstreamLimiter("test", rate=1, burst=1, max_wait=0.1)
+    assert limiter.try_acquire()
+
+    start = time.monotonic()
+    with pytest.raises(UpstreamOverloaded, match="exceeds"):
+        limiter.acquire()
+    assert time.monotonic() - start < 0.05
+    assert not limiter._queue
+
+
+def test_deadline_shorter_than_max_wait_raises_deadline_exceeded():
+    limiter = UpstreamLimiter("test", rate=1, burst=1, max_wait=30)
+    assert limiter.try_acquire()
+
+    with pytest.raises(DeadlineExceeded):
+        limiter.acquire(deadline=Deadline(0.1))
+
+
+def test_try_acquire_does_not_jump_the_queue(limiter):
+    waiter = threading.Thread(target=limiter.acquire)
+    waiter.start()
+    _wait_for_queue(limiter, 1)
+    time.sleep(0.06)
+
+    # The slot is free again, but it belongs to the waiting request.
+    assert not limiter.try_acquire()
+    waiter.join(2)
+
+
+def _rate_limit_error(headers: dict) -> Exception:
+    error = RuntimeError("429 Too Many Requests")
+    error.response = SimpleNamespace(status_code=429, headers=headers)
+    return error
+
+
+def test_429_pauses_the_upstream_for_retry_after(gemini_limiter):
+    with pytest.raises(RuntimeError):
+        with upstream_call(GEMINI):
+            raise _rate_limit_error({"Retry-After": "2"})
+
+    assert not gemini_limiter.try_acquire()
+    assert gemini_limiter._delay(0, time.monotonic()) == pytest.approx(2, abs=0.1)
+
+
+def test_429_without_usable_retry_after_uses_default_backoff(gemini_limiter):
+    with pytest.raises(RuntimeError):
+        with upstream_call(GEMINI):
+            raise _rate_limit_error({"Retry-After": "Wed, 21 Oct 2026 07:28:00 GMT"})
+
+    assert gemini_limiter._delay(0, time.monotonic()) == pytest.approx(RATE_LIMIT_BACKOFF, abs=0.1)
+
+
+def test_other_errors_do_not_pause_the_upstream(gemini_limiter):
+    with pytest.raises(ValueError):
+        with upstream_call(GEMINI):
+            raise ValueError("bad reply")
+
+    assert gemini_limiter.try_acquire()
+
+
+class _Upstream(BaseHTTPRequestHandler):
+    status = 429
+    requests_seen = 0
+
+    def do_GET(self):
+        type(self).requests_seen += 1
+        self.send_response(self.status)
+        self.send_header("Retry-After", "1")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_upstream():
+    server = HTTPServer(("127.0.0.1", 0), _Upstream)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    _Upstream.requests_seen = 0
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_session_does_not_resend_requests_behind_the_schedulers_back(local_upstream, gemini_limiter, status):
+    _Upstream.status = status
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        with upstream_call(GEMINI):
+            build_http_session().get(local_upstream, timeout=5).raise_for_status()
+
+    assert _Upstream.requests_seen == 1
+    # The 429 reached upstream_call, which paused the upstream for Retry-After.
+    assert gemini_limiter.try_acquire() is (status != 429)
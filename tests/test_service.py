@@ -0,0 +1,94 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+import service
+from service import PlanService, SingleFlight, plan_key
+
+
+def _route(plan_service: PlanService, body: dict, method: str = "POST", path: str = "/plan") -> tuple[int, dict]:
+    status, _, payload = asyncio.run(plan_service.route(method, path, json.dumps(body).encode()))
+    return status, json.loads(payload)
+
+
+def test_single_flight_shares_one_computation():
+    calls = []
+
+    async def compute() -> str:
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "plan"
+
+    async def main() -> list:
+        single_flight = SingleFlight()
+        results = await asyncio.gather(*(single_flight.do("kochi|3", compute) for _ in range(5)))
+        return results + [len(single_flight)]
+
+    *results, in_flight = asyncio.run(main())
+
+    assert calls == [1]
+    assert [result for result, _ in results] == ["plan"] * 5
+    assert [shared for _, shared in results] == [False, True, True, True, True]
+    assert in_flight == 0
+
+
+def test_equivalent_queries_share_a_key():
+    assert plan_key("I am planning a trip to Kochi", 3) == plan_key("visit kochi", 3)
+    assert plan_key("visit kochi", 3) != plan_key("visit kochi", 2)
+
+
+def test_plan_is_returned(monkeypatch):
+    monkeypatch.setattr(service, "run_pipeline", lambda query, days, *keys: {"place": "Kochi", "days": days})
+
+    status, body = _route(PlanService("weather", "gemini"), {"query": "trip to Kochi", "days": 2})
+
+    assert status == 200
+    assert body == {"place": "Kochi", "days": 2, "shared": False}
+
+
+@pytest.mark.parametrize("body", [{}, {"query": ""}, {"query": "Kochi", "days": 9}, {"query": "Kochi", "days": "two"}])
+def test_invalid_requests_get_400(body):
+    status, response = _route(PlanService("weather", "gemini"), body)
+
+    assert status == 400
+    assert response["error"].startswith("Invalid request")
+
+
+def test_pipeline_errors_get_a_500_json_response(monkeypatch):
+    def fail(*args):
+        raise OSError("database is locked")
+    monkeypatch.setattr(service, "run_pipeline", fail)
+
+    status, body = _route(PlanService("weather", "gemini"), {"query": "trip to Kochi"})
+
+    assert status == 500
+    assert body == {"error": "Could not build the plan: database is locked"}
+
+
+def test_plans_beyond_the_pending_limit_get_503(monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(service, "run_pipeline", lambda query, days, *keys: release.wait(5) and {"place": query})
+    plan_service = PlanService("weather", "gemini", max_concurrency=1, max_pending=1)
+
+    async def main() -> list:
+        running = asyncio.ensure_future(plan_service.route("POST", "/plan", b'{"query": "trip to Kochi"}'))
+        await asyncio.sleep(0.05)
+        waiting = asyncio.ensure_future(plan_service.route("POST", "/plan", b'{"query": "trip to Paris"}'))
+        await asyncio.sleep(0.05)
+        rejected = await plan_service.route("POST", "/plan", b'{"query": "trip to Munnar"}')
+        release.set()
+        return [rejected, await running, await waiting]
+
+    statuses = [status for status, _, _ in asyncio.run(main())]
+
+    assert statuses == [503, 200, 200]
+
+
+def test_unknown_paths_and_methods():
+    plan_service = PlanService("weather", "gemini")
+
+    assert _route(plan_service, {}, path="/nope")[0] == 404
+    assert _route(plan_service, {}, method="GET")[0] == 405
+    assert _route(plan_service, {}, method="GET", path="/healthz") == (200, {"status": "ok", "in_flight": 0})